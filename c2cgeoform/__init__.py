@@ -25,6 +25,11 @@ default_map_settings = {
         'zoom': 7,
     },
     'fitSource': False,
+    'bboxLoading': False,
+    'simplify': False,
+    'cluster': False,
+    'flatgeobuf': False,
+    'vectorTiles': False,
     'fitMaxZoom': 14,
     'focusOnly': False,
     'geolocationTooltip': _('Zoom to current location'),
@@ -0,0 +1,238 @@
+import itertools
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import Session
+
+
+# versions by model class, see ``model_version``
+_versions = {}
+_versions_lock = threading.Lock()
+
+# related model classes by model class, see ``related_models``
+_related_models = {}
+
+# identifies this process versions, which restart from 0 in each process
+boot_token = uuid.uuid4().hex
+
+
+def model_version(model):
+    """
+    Return the current version of ``model``.
+
+    The version is incremented when rows of the model are inserted, updated
+    or deleted through an SQLAlchemy session of the current process, so it
+    can be used in cache keys to invalidate cached values derived from the
+    model rows.
+    """
+    return _versions.get(inspect(model).class_, 0)
+
+
+def related_models(model):
+    """
+    Return ``model`` and the model classes reachable through its
+    relationships, recursively.
+    """
+    class_ = inspect(model).class_
+    models = _related_models.get(class_)
+    if models is None:
+        models = [class_]
+        for model_ in models:
+            for relationship in inspect(model_).relationships:
+                if relationship.mapper.class_ not in models:
+                    models.append(relationship.mapper.class_)
+        models = _related_models[class_] = tuple(models)
+    return models
+
+
+def related_version(model):
+    """
+    Return a version of ``model`` which also changes when rows of the models
+    reachable through its relationships are inserted, updated or deleted, see
+    ``model_version``.
+    """
+    return sum(model_version(model_) for model_ in related_models(model))
+
+
+def bump_model_version(model):
+    """
+    Increment the version of ``model`` and of the models it inherits from.
+    """
+    with _versions_lock:
+        for mapper in inspect(model).iterate_to_root():
+            _versions[mapper.class_] = _versions.get(mapper.class_, 0) + 1
+
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    models = set(
+        inspect(obj).mapper.class_
+        for obj in itertools.chain(session.new, session.dirty, session.deleted)
+    )
+    for model in models:
+        bump_model_version(model)
+    # bump again when the transaction ends, values computed by concurrent
+    # requests in the meantime did not see the flushed rows
+    session.info.setdefault('c2cgeoform_flushed_models', set()).update(models)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _after_transaction(session):
+    for model in session.info.pop('c2cgeoform_flushed_models', ()):
+        bump_model_version(model)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _after_bulk(context):
+    bump_model_version(context.mapper)
+    context.session.info.setdefault('c2cgeoform_flushed_models', set()).add(
+        context.mapper.class_)
+
+
+class LRUCache():
+    """
+    A thread-safe mapping holding at most ``maxsize`` entries, the least
+    recently used entries being evicted first.
+
+    Example usage
+
+    .. code-block:: python
+
+        cache = LRUCache(maxsize=100)
+        value = cache.get(key)
+        if value is None:
+            value = cache[key] = compute_value()
+    """
+
+    def __init__(self, maxsize=128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ResponseCache():
+    """
+    A cache of response ``(content_type, body)`` tuples, keeping at most
+    ``maxsize`` entries in memory and, when a ``directory`` is given, at most
+    ``disk_maxsize`` entries in files of this directory, each entry expiring
+    ``ttl`` seconds after it was stored.
+
+    Keys are used as file names, so they have to be safe for that, like
+    hexadecimal digests. Keys should contain a version of the data (see
+    ``model_version``), so that the entries get stale rather than invalid;
+    the least recently used entries are evicted first. As the versions are
+    tracked per process, keys should also contain ``boot_token``, and the
+    ``ttl`` bounds how long changes made by other processes are not seen.
+
+    Example usage
+
+    .. code-block:: python
+
+        class ExcavationViews(AbstractViews):
+            _geojson_cache = ResponseCache(maxsize=16, directory='/var/cache/geojson')
+    """
+
+    def __init__(self, maxsize=32, directory=None, disk_maxsize=1024, ttl=60):
+        self._memory = LRUCache(maxsize=maxsize)
+        self._directory = directory
+        self._disk_maxsize = disk_maxsize
+        self._ttl = ttl
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key, default=None):
+        entry = self._memory.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        value = None
+        if self._directory is not None:
+            value = self._read(key)
+            if value is not None:
+                # keep it in memory until the disk entry expires
+                expires, value = value
+                self._memory[key] = (time.monotonic() + expires - time.time(), value)
+        return default if value is None else value
+
+    def __setitem__(self, key, value):
+        self._memory[key] = (time.monotonic() + self._ttl, value)
+        if self._directory is not None:
+            self._write(key, value)
+
+    def _read(self, key):
+        path = os.path.join(self._directory, key)
+        try:
+            with open(path, 'rb') as file_:
+                expires = float(file_.readline())
+                content_type = file_.readline().decode('utf-8').rstrip('\n')
+                body = file_.read() if expires > time.time() else None
+            if body is None:
+                os.remove(path)
+                return None
+            # touch the file so that pruning evicts the least recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return expires, (content_type, body)
+
+    def _write(self, key, value):
+        content_type, body = value
+        fd, path = tempfile.mkstemp(dir=self._directory, prefix='.')
+        with os.fdopen(fd, 'wb') as file_:
+            file_.write('{}\n'.format(time.time() + self._ttl).encode('utf-8'))
+            file_.write(content_type.encode('utf-8') + b'\n')
+            file_.write(body)
+        os.replace(path, os.path.join(self._directory, key))
+        self._prune()
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self._directory):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                # removed by another process meanwhile
+                pass
+        if len(entries) <= self._disk_maxsize:
+            return
+        entries.sort()
+        for dummy, path in entries[:len(entries) - self._disk_maxsize]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,16 +1,42 @@
 
 from colander import (null, Invalid, SchemaType)
 
+from functools import lru_cache
 from geoalchemy2 import WKBElement
 from geoalchemy2.shape import to_shape, from_shape
 from shapely.geometry import mapping, shape
-from shapely.ops import transform
+import numpy
 import pyproj
+import shapely
 import json
 from io import BytesIO
 import os
 
 
+@lru_cache(maxsize=None)
+def get_transformer(source_srid, target_srid):
+    """
+    Return the ``pyproj.Transformer`` from ``source_srid`` to
+    ``target_srid``, created once per process and shared by the threads
+    (transformers are thread-safe since pyproj 3.1).
+    """
+    return pyproj.Transformer.from_crs(source_srid, target_srid, always_xy=True)
+
+
+def reproject(geometry, source_srid, target_srid):
+    """
+    Return ``geometry`` reprojected from ``source_srid`` to ``target_srid``,
+    transforming all its coordinates at once as NumPy arrays.
+    """
+    transformer = get_transformer(source_srid, target_srid)
+
+    def transform_coordinates(coordinates):
+        return numpy.column_stack(transformer.transform(*coordinates.T))
+
+    return shapely.transform(
+        geometry, transform_coordinates, include_z=bool(shapely.has_z(geometry)))
+
+
 class Geometry(SchemaType):
     """ A Colander type meant to be used with GeoAlchemy 2 geometry columns.
 
@@ -46,19 +72,6 @@ class Geometry(SchemaType):
         if self.map_srid == -1:
             self.map_srid = self.srid
 
-        if self.srid != self.map_srid:
-            self.project_db_to_map = pyproj.Transformer.from_crs(
-                self.srid,
-                self.map_srid,
-                always_xy=True,
-            ).transform
-
-            self.project_map_to_db = pyproj.Transformer.from_crs(
-                self.map_srid,
-                self.srid,
-                always_xy=True,
-            ).transform
-
     def serialize(self, node, appstruct):
         """
         In Colander speak: Converts a Python data structure (an appstruct) into
@@ -70,7 +83,7 @@ class Geometry(SchemaType):
         if isinstance(appstruct, WKBElement):
             geometry = to_shape(appstruct)
             if self.srid != self.map_srid and appstruct.srid != self.map_srid:
-                geometry = transform(self.project_db_to_map, geometry)
+                geometry = reproject(geometry, self.srid, self.map_srid)
 
             return json.dumps(mapping(geometry))
         raise Invalid(node, 'Unexpected value: %r' % appstruct)
@@ -91,7 +104,7 @@ class Geometry(SchemaType):
             raise Invalid(node, 'Invalid geometry: %r' % cstruct)
 
         if self.srid != self.map_srid:
-            geometry = transform(self.project_map_to_db, geometry)
+            geometry = reproject(geometry, self.map_srid, self.srid)
 
         return from_shape(geometry, srid=self.srid)
 
@@ -6,18 +6,170 @@ from deform.compat import string_types
 from colander import (Invalid, null)
 from deform.widget import (FileUploadWidget as DeformFileUploadWidget,
                            MappingWidget)
+from pyramid.httpexceptions import HTTPBadRequest, HTTPNotModified
+from pyramid.threadlocal import get_current_request
 from sqlalchemy import inspect
+import hashlib
 import urllib
 import json
 import logging
 import os
+import time
 from io import BytesIO, BufferedRandom
 
 from c2cgeoform import default_map_settings
+from c2cgeoform.cache import LRUCache, model_version
+from c2cgeoform.views.search import relation_search_query
 
 _ = TranslationStringFactory('c2cgeoform')
 log = logging.getLogger(__name__)
 
+# ``(version, expires, values)`` of the relation widgets by model, fields,
+# order and locale, see ``RelationSelectMixin``
+_options_cache = LRUCache(maxsize=1024)
+
+# widgets answering the ``c2cgeoform_relation`` route by key, see
+# ``register_remote_widget``
+_remote_widgets = {}
+
+# ``(expires, results)`` of the RelationSearchWidget built-in service by widget
+# key, term and model version
+_search_cache = LRUCache(maxsize=4096)
+
+# ``(expires, version, body)`` of the RelationSearchWidget prefetched data by
+# widget key and model version
+_prefetch_cache = LRUCache(maxsize=256)
+
+
+def set_widget_state(widget, request, state):
+    """
+    Store the ``state`` dictionary computed by the ``populate`` method of ``widget`` for
+    ``request``.
+
+    Schemas and their widgets are usually module level instances shared by
+    all the requests and threads, so the state is kept in the request rather
+    than in attributes of the widget.
+    """
+    if request is None:
+        raise ValueError('The widgets are populated for a request')
+    states = getattr(request, 'c2cgeoform_widget_states', None)
+    if states is None:
+        states = request.c2cgeoform_widget_states = {}
+    states[widget] = state
+
+
+def get_widget_state(widget, request, name, default=None):
+    """
+    Return the ``name`` value stored with ``set_widget_state`` for ``widget``
+    and ``request``, usually the request of the rendered field, see
+    ``field_request``.
+    """
+    state = getattr(request, 'c2cgeoform_widget_states', {}).get(widget)
+    return default if state is None else state.get(name, default)
+
+
+def field_request(field):
+    """
+    Return the request of the form of ``field``.
+
+    The views give their request to the forms as the ``request`` keyword
+    argument, which deform sets on all the fields of the form. Otherwise,
+    the request the schema is bound to is used, if any.
+    """
+    request = getattr(field, 'request', None)
+    if request is None:
+        bindings = getattr(field.schema, 'bindings', None) or {}
+        request = bindings.get('request')
+    return request
+
+
+class LookupResolver():
+    """
+    Resolve the labels of the values of the relation widgets of a form, with
+    one query per model and label field.
+
+    The views collect the values of the form with ``add`` before rendering it,
+    so that the labels of all the values, including the values of sequence
+    items, are loaded together on the first call to ``label``.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._pending = {}
+        self._labels = {}
+
+    def add(self, model, label_field, ids, id_field=None):
+        key = (inspect(model).class_, label_field, id_field)
+        labels = self._labels.get(key, {})
+        pending = self._pending.setdefault(key, set())
+        pending.update(str(id_) for id_ in ids if str(id_) not in labels)
+
+    def label(self, model, label_field, id_, id_field=None):
+        key = (inspect(model).class_, label_field, id_field)
+        if str(id_) not in self._labels.get(key, {}):
+            self.add(model, label_field, [id_], id_field)
+            self._resolve(key)
+        return self._labels[key].get(str(id_))
+
+    def _resolve(self, key):
+        model, label_field, id_field = key
+        ids = self._pending.pop(key, set())
+        labels = self._labels.setdefault(key, {})
+        mapper = inspect(model)
+        if id_field is None:
+            id_column = mapper.primary_key[0]
+            id_field = mapper.get_property_by_column(id_column).key
+        else:
+            id_column = getattr(model, id_field)
+        if label_field in mapper.all_orm_descriptors:
+            # only load the id and label columns
+            rows = self.session.query(id_column, getattr(model, label_field)). \
+                filter(id_column.in_(ids))
+        else:
+            rows = (
+                (getattr(entity, id_field), getattr(entity, label_field))
+                for entity in self.session.query(model).filter(id_column.in_(ids)))
+        for id_, label in rows:
+            labels[str(id_)] = label
+        # do not query again the ids which do not exist
+        for id_ in ids:
+            labels.setdefault(id_, None)
+
+
+def register_remote_widget(widget, model, *args):
+    """
+    Register ``widget`` to answer the requests of the ``c2cgeoform_relation``
+    route, and return its key in the route.
+
+    The key is computed from the widget class, the ``model`` and ``args``, so
+    that it is the same in all the processes of the application.
+    """
+    model = inspect(model).class_
+    config = (type(widget).__name__, model.__module__, model.__qualname__) + args
+    key = hashlib.sha1(repr(config).encode('utf-8')).hexdigest()[:16]
+    _remote_widgets[key] = widget
+    return key
+
+
+def get_remote_widget(key):
+    """
+    Return the widget registered with ``register_remote_widget`` for ``key``.
+    """
+    return _remote_widgets.get(key)
+
+
+def lookup_resolver(request, session):
+    """
+    Return the ``LookupResolver`` of ``request``, a new one when ``request``
+    is ``None``.
+    """
+    if request is None:
+        return LookupResolver(session)
+    resolver = getattr(request, 'c2cgeoform_lookup_resolver', None)
+    if resolver is None:
+        resolver = request.c2cgeoform_lookup_resolver = LookupResolver(session)
+    return resolver
+
 
 class MapWidget(Widget):
     """
@@ -124,8 +276,16 @@ class MapWidget(Widget):
 class RelationSelectMixin(object):
     """
     Mixin class to support relations for select fields.
+
+    The ``(id, label)`` tuples loaded from the database are cached for
+    ``cache_ttl`` seconds, by model, fields, order and locale. The cache is
+    invalidated when rows of the model are flushed through an SQLAlchemy
+    session of the current process, see ``c2cgeoform.cache.model_version``.
+    Use ``cache_ttl=0`` to disable the cache.
     """
 
+    cache_ttl = 60
+
     def __init__(
             self, model, id_field, label_field,
             default_value=None, order_by=None):
@@ -135,27 +295,64 @@ class RelationSelectMixin(object):
         self.default_value = default_value
         self.order_by = order_by
 
+    @property
+    def values(self):
+        # the widgets classes repeat this property, the deform base classes
+        # also define a ``values`` attribute; the serialize methods give the
+        # values of the request of the field to the templates instead
+        return get_widget_state(self, get_current_request(), 'values', ())
+
     def populate(self, session, request):
-        self.values = self._get_select_values(session)
+        set_widget_state(
+            self, request, {'values': self._get_select_values(session, request)})
 
-    def _get_select_values(self, session):
+    def _field_values(self, field):
+        return get_widget_state(self, field_request(field), 'values', ())
+
+    def _get_select_values(self, session, request=None):
+        values = self._get_cached_values(session, request)
+
+        if self.default_value is None:
+            return values
+        else:
+            return (self.default_value,) + values
+
+    def _get_cached_values(self, session, request):
+        if not self.cache_ttl:
+            return self._query_values(session)
+
+        model = inspect(self.model).class_
+        key = (model, self.id_field, self.label_field, self.order_by,
+               getattr(request, 'locale_name', None))
+        version = model_version(model)
+        cached = _options_cache.get(key)
+        if cached is not None and cached[0] == version and cached[1] > time.monotonic():
+            return cached[2]
+
+        values = self._query_values(session)
+        _options_cache[key] = (version, time.monotonic() + self.cache_ttl, values)
+        return values
+
+    def _query_values(self, session):
         model = inspect(self.model)
         if self.order_by is not None:
             order_by = getattr(model.columns, self.order_by)
         else:
             order_by = None
 
-        entities = session.query(model).order_by(order_by)
+        descriptors = model.all_orm_descriptors
+        if self.id_field in descriptors and self.label_field in descriptors:
+            # only load the id and label columns
+            rows = session.query(
+                getattr(model.class_, self.id_field),
+                getattr(model.class_, self.label_field)).order_by(order_by)
+            return tuple((id_, label) for id_, label in rows)
 
-        values = tuple(
+        entities = session.query(model).order_by(order_by)
+        return tuple(
             (getattr(entity, self.id_field), getattr(entity, self.label_field))
             for entity in entities)
 
-        if self.default_value is None:
-            return values
-        else:
-            return (self.default_value,) + values
-
 
 class RelationMultiSelectMixin(RelationSelectMixin):
     """
@@ -278,6 +475,11 @@ class RelationSelectWidget(SelectWidget, RelationMultiSelectMixin):
         the SQL query.
         Default: ``None``.
 
+    cache_ttl
+        The number of seconds the values loaded from the database are cached,
+        ``0`` to disable the cache.
+        Default: ``60``.
+
     default_value
         A default value that is added add the beginning of the list of values
         that were loaded from the database.
@@ -294,6 +496,8 @@ class RelationSelectWidget(SelectWidget, RelationMultiSelectMixin):
 
     """
 
+    values = RelationSelectMixin.values
+
     def __init__(
             self, model, id_field='id', label_field='label',
             default_value=None, order_by=None, **kw):
@@ -311,6 +515,7 @@ class RelationSelectWidget(SelectWidget, RelationMultiSelectMixin):
         if self.multiple:
             cstruct = RelationMultiSelectMixin.serialize(
                 self, field, cstruct, **kw)
+        kw.setdefault('values', self._field_values(field))
         return SelectWidget.serialize(self, field, cstruct, **kw)
 
 
@@ -380,6 +585,11 @@ class RelationSelect2Widget(Select2Widget, RelationMultiSelectMixin):
         the SQL query.
         Default: ``None``.
 
+    cache_ttl
+        The number of seconds the values loaded from the database are cached,
+        ``0`` to disable the cache.
+        Default: ``60``.
+
     default_value
         A default value that is added add the beginning of the list of values
         that were loaded from the database.
@@ -390,18 +600,75 @@ class RelationSelect2Widget(Select2Widget, RelationMultiSelectMixin):
         Allow to select multiple values. Requires a n:m relationship.
         Default: ``False``.
 
+    remote
+        Render only the selected options, and let Select2 load the matching
+        options page by page while the user types, from the
+        ``c2cgeoform_relation`` route. Use it for large tables.
+        Default: ``False``.
+
+    search_mode
+        How the options are matched in remote mode, ``'prefix'`` or
+        ``'trigram'``, see ``c2cgeoform.views.search.relation_search_query``.
+        Default: ``'prefix'``.
+
+    page_size
+        The number of options loaded per page in remote mode.
+        Default: ``20``.
+
+    min_length
+        The minimum number of characters to type before the options are loaded
+        in remote mode.
+        Default: ``0``.
+
     For further attributes, please refer to the documentation of
     ``deform.widget.Select2Widget`` in the deform documentation:
     <http://deform.readthedocs.org/en/latest/api.html>
 
     """
 
+    values = RelationSelectMixin.values
+    remote = False
+    search_mode = 'prefix'
+    page_size = 20
+    min_length = 0
+
     def __init__(
             self, model, id_field='id', label_field='label',
             default_value=None, order_by=None, **kw):
         RelationMultiSelectMixin.__init__(
             self, model, id_field, label_field, default_value, order_by)
         Select2Widget.__init__(self, **kw)
+        if self.remote:
+            self.template = 'relation_select2'
+            self.remote_key = register_remote_widget(
+                self, model, id_field, label_field, order_by, self.search_mode,
+                self.page_size)
+
+    def populate(self, session, request):
+        if not self.remote:
+            return RelationSelectMixin.populate(self, session, request)
+        set_widget_state(self, request, {
+            'url': request.route_url('c2cgeoform_relation', key=self.remote_key),
+            'resolver': lookup_resolver(request, session),
+        })
+
+    def prefetch_labels(self, values, request):
+        """
+        Add the selected ``values`` to the labels to load with the
+        ``LookupResolver`` of ``request``, in remote mode.
+        """
+        resolver = get_widget_state(self, request, 'resolver')
+        if resolver is None:
+            return
+        ids = []
+        for value in values:
+            if self.multiple:
+                ids += [
+                    obj[self.id_field] if isinstance(obj, dict) else obj
+                    for obj in value]
+            else:
+                ids.append(value)
+        resolver.add(self.model, self.label_field, ids, self.id_field)
 
     def deserialize(self, field, pstruct):
         if self.multiple:
@@ -413,8 +680,59 @@ class RelationSelect2Widget(Select2Widget, RelationMultiSelectMixin):
         if self.multiple:
             cstruct = RelationMultiSelectMixin.serialize(
                 self, field, cstruct, **kw)
+        request = field_request(field)
+        if self.remote:
+            kw['values'] = self._selected_values(cstruct, request)
+            kw['select2_options'] = json.dumps({
+                'ajax': {
+                    'url': get_widget_state(self, request, 'url'),
+                    'dataType': 'json',
+                    'delay': 250,
+                },
+                'minimumInputLength': self.min_length,
+            })
+        else:
+            kw.setdefault('values', get_widget_state(self, request, 'values', ()))
         return Select2Widget.serialize(self, field, cstruct, **kw)
 
+    def _selected_values(self, cstruct, request):
+        if cstruct in (null, None, ''):
+            ids = []
+        elif self.multiple:
+            ids = cstruct
+        else:
+            ids = [cstruct]
+        resolver = get_widget_state(self, request, 'resolver')
+        values = []
+        for id_ in ids:
+            label = None
+            if resolver is not None:
+                label = resolver.label(self.model, self.label_field, id_, self.id_field)
+            values.append((id_, id_ if label is None else label))
+        if self.default_value is not None:
+            values.insert(0, self.default_value)
+        return tuple(values)
+
+    def remote_response(self, request):
+        """
+        Return the page of options matching the ``term`` parameter, in the
+        format expected by Select2.
+        """
+        try:
+            page = max(int(request.params.get('page', 1)), 1)
+        except ValueError:
+            raise HTTPBadRequest('Invalid page')
+        rows = relation_search_query(
+            request.dbsession, self.model, self.id_field, self.label_field,
+            request.params.get('term', ''), self.search_mode, self.order_by). \
+            offset((page - 1) * self.page_size).limit(self.page_size + 1).all()
+        return {
+            'results': [
+                {'id': id_, 'text': label} for id_, label in rows[:self.page_size]
+            ],
+            'pagination': {'more': len(rows) > self.page_size},
+        }
+
 
 class RelationCheckBoxListWidget(CheckboxChoiceWidget,
                                  RelationMultiSelectMixin):
@@ -466,6 +784,12 @@ class RelationCheckBoxListWidget(CheckboxChoiceWidget,
         The property of the model that is used for the ``order_by`` clause of
         the SQL query.
         Default: ``None``.
+
+    cache_ttl
+        The number of seconds the values loaded from the database are cached,
+        ``0`` to disable the cache.
+        Default: ``60``.
+
     edit_url (optionnal)
         a function taking request and value as parameter and returning
         an url to the correponding resource.
@@ -474,6 +798,8 @@ class RelationCheckBoxListWidget(CheckboxChoiceWidget,
     ``deform.widget.Select2Widget`` in the deform documentation:
     <http://deform.readthedocs.org/en/latest/api.html>
     """
+    values = RelationSelectMixin.values
+
     def __init__(
             self, model, id_field='id', label_field='label',
             order_by=None, **kw):
@@ -487,6 +813,7 @@ class RelationCheckBoxListWidget(CheckboxChoiceWidget,
     def serialize(self, field, cstruct, **kw):
         cstruct = RelationMultiSelectMixin.serialize(
             self, field, cstruct, **kw)
+        kw.setdefault('values', self._field_values(field))
         return CheckboxChoiceWidget.serialize(self, field, cstruct, **kw)
 
 
@@ -531,12 +858,19 @@ class RelationRadioChoiceWidget(RadioChoiceWidget, RelationSelectMixin):
         the SQL query.
         Default: ``None``.
 
+    cache_ttl
+        The number of seconds the values loaded from the database are cached,
+        ``0`` to disable the cache.
+        Default: ``60``.
+
     For further attributes, please refer to the documentation of
     ``deform.widget.RadioChoiceWidget`` in the deform documentation:
     <http://deform.readthedocs.org/en/latest/api.html>
 
     """
 
+    values = RelationSelectMixin.values
+
     def __init__(
             self, model, id_field='id', label_field='label',
             order_by=None, **kw):
@@ -544,6 +878,10 @@ class RelationRadioChoiceWidget(RadioChoiceWidget, RelationSelectMixin):
             self, model, id_field, label_field, None, order_by)
         RadioChoiceWidget.__init__(self, **kw)
 
+    def serialize(self, field, cstruct, **kw):
+        kw.setdefault('values', self._field_values(field))
+        return RadioChoiceWidget.serialize(self, field, cstruct, **kw)
+
 
 class FileUploadTempStore():
 
@@ -639,12 +977,19 @@ class FileUploadWidget(DeformFileUploadWidget):
     id_field = "id"
 
     def __init__(self, get_url=None, **kw):
-        DeformFileUploadWidget.__init__(self, None, **kw)
+        # the temporary store depends on the request, see ``populate``
+        Widget.__init__(self, **kw)
         self.get_url = get_url
 
+    @property
+    def tmpstore(self):
+        # read by the deform serialize and deserialize methods
+        return get_widget_state(self, get_current_request(), 'tmpstore')
+
     def populate(self, session, request):
-        self.request = request
-        self.tmpstore = FileUploadTempStore(request.session)
+        set_widget_state(self, request, {
+            'tmpstore': FileUploadTempStore(request.session),
+        })
 
     def serialize(self, field, cstruct, **kw):
         if cstruct in (null, None):
@@ -653,7 +998,8 @@ class FileUploadWidget(DeformFileUploadWidget):
         if 'uid' not in cstruct and self.id_field in cstruct:
             cstruct['uid'] = cstruct[self.id_field]
             if cstruct[self.id_field] != null and self.get_url:
-                kw['url'] = self.get_url(self.request, cstruct[self.id_field])
+                kw['url'] = self.get_url(
+                    field_request(field), cstruct[self.id_field])
         if cstruct.get('filename', None) == null:
             cstruct['filename'] = ""
         return DeformFileUploadWidget.serialize(self, field, cstruct, **kw)
@@ -718,11 +1064,9 @@ class RelationSelectMapWidget(Widget):
         Widget.__init__(self, **kw)
         self.label_field = label_field
         self.get_url = url if callable(url) else lambda request: url
-        self.url = None
 
     def populate(self, session, request):
-        if self.url is None:
-            self.url = self.get_url(request)
+        set_widget_state(self, request, {'url': self.get_url(request)})
 
     def serialize(self, field, cstruct, readonly=False, **kw):
         if cstruct is null:
@@ -732,7 +1076,7 @@ class RelationSelectMapWidget(Widget):
         values['_'] = TranslationStringFactory('c2cgeoform')
         values['widget_config'] = json.dumps({
             'labelField': self.label_field,
-            'url': self.url,
+            'url': get_widget_state(self, field_request(field), 'url'),
             'readonly': readonly
         })
         return field.renderer('map_select', **values)
@@ -755,7 +1099,6 @@ class RelationSearchWidget(Widget):
             'colanderalchemy': {
                 'title': _('Address'),
                 'widget': deform_ext.RelationSearchWidget(
-                    url=lambda request: request.route_url('addresses'),
                     model=Address,
                     min_length=1,
                     id_field='id',
@@ -763,9 +1106,14 @@ class RelationSearchWidget(Widget):
                 )
             }})
 
-    The user is responsible for providing a web-service at the given URL.  The
-    web service should expect requests of the form ``?term=<search_terms>``.
-    And it should return responses of this form:
+    Without ``url``, the suggestions are loaded from the ``c2cgeoform_relation``
+    route, which selects the ``id_field`` and ``label_field`` columns of the
+    ``model`` rows matching the search terms, see
+    ``c2cgeoform.views.search.relation_search_query``.
+
+    Otherwise the user is responsible for providing a web-service at the given
+    URL. The web service should expect requests of the form
+    ``?term=<search_terms>``. And it should return responses of this form:
 
     .. code-block:: json
 
@@ -775,9 +1123,9 @@ class RelationSearchWidget(Widget):
 
     **Attributes/arguments**
 
-    url (required)
+    url
         The search service URL, or a function that takes a request a return the
-        search service URL.
+        search service URL. Default: ``None``, use the built-in service.
 
     model (required)
         The SQLAlchemy model class associated to the linked table.
@@ -796,34 +1144,146 @@ class RelationSearchWidget(Widget):
     limit
         The maximum number of suggestions. Default: 8.
 
+    search_mode
+        How the built-in service matches the labels, ``'prefix'`` or
+        ``'trigram'``. Default: ``'prefix'``.
+
+    cache_length
+        The suggestions of the built-in service for search terms of up to
+        ``cache_length`` characters, the most frequent and the most expensive,
+        are cached until the model rows are modified, for at most
+        ``cache_ttl`` seconds. Default: ``3``.
+
+    cache_ttl
+        The number of seconds the suggestions of the built-in service are
+        cached, which bounds how long the changes made by other processes
+        are not seen, ``0`` to disable the cache. Default: ``60``.
+
+    prefetch
+        For small tables, load all the ``(id, label)`` pairs of the model once
+        from the built-in service, and filter them in the browser instead of
+        sending a request per keystroke. The data is cached like the
+        suggestions, for ``cache_ttl`` seconds. Its URL contains a digest of
+        the data, so that browsers can cache it as immutable.
+        Default: ``False``.
+
     """
     id_field = 'id'
     label_field = 'label'
     limit = 8
     min_length = 1
+    search_mode = 'prefix'
+    cache_length = 3
+    cache_ttl = 60
+    prefetch = False
     readonly_template = 'readonly/textinput'
     strip = True
     template = 'search'
     requirements = (('typeahead', '0.10.5'),)
 
-    def __init__(self, url, **kw):
+    def __init__(self, url=None, **kw):
         Widget.__init__(self, **kw)
+        if url is None or self.prefetch:
+            self.remote_key = register_remote_widget(
+                self, self.model, self.id_field, self.label_field,
+                self.search_mode, self.limit, self.prefetch)
+        if url is None:
+            url = self._remote_url
         self.get_url = url if callable(url) else lambda request: url
-        self.url = None
-        self.session = None
+
+    def _remote_url(self, request, **query):
+        return request.route_url(
+            'c2cgeoform_relation', key=self.remote_key, _query=query)
+
+    def _prefetch_data(self, session):
+        """
+        Return the version and the JSON body of the ``[id, label]`` pairs of
+        all the model rows.
+        """
+        key = (self.remote_key, model_version(self.model))
+        entry = _prefetch_cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1:]
+        rows = relation_search_query(
+            session, self.model, self.id_field, self.label_field, '')
+        body = json.dumps(
+            [[id_, label] for id_, label in rows],
+            separators=(',', ':')).encode('utf-8')
+        version = hashlib.sha1(body).hexdigest()[:16]
+        if self.cache_ttl:
+            _prefetch_cache[key] = (time.monotonic() + self.cache_ttl, version, body)
+        return version, body
+
+    def _prefetch_response(self, request):
+        version, body = self._prefetch_data(request.dbsession)
+        if request.params.get('v') == version:
+            # the version is a digest of the body, the URL changes with the data
+            cache_control = 'public, max-age=31536000, immutable'
+        else:
+            cache_control = 'no-cache'
+        if version in request.if_none_match:
+            return HTTPNotModified(etag=version, cache_control=cache_control)
+        response = request.response
+        response.content_type = 'application/json'
+        response.etag = version
+        response.cache_control = cache_control
+        response.body = body
+        return response
+
+    def remote_response(self, request):
+        """
+        Return the suggestions of the built-in service for the ``term``
+        parameter, or all the ``[id, label]`` pairs in prefetch mode.
+        """
+        if self.prefetch and 'term' not in request.params:
+            return self._prefetch_response(request)
+        if 'term' not in request.params:
+            raise HTTPBadRequest('Missing term')
+        term = request.params['term'].strip().lower()
+        cached = self.cache_ttl and len(term) <= self.cache_length
+        if cached:
+            key = (self.remote_key, term, model_version(self.model))
+            entry = _search_cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        rows = relation_search_query(
+            request.dbsession, self.model, self.id_field, self.label_field,
+            term, self.search_mode).limit(self.limit)
+        results = [
+            {self.id_field: id_, self.label_field: label} for id_, label in rows
+        ]
+        if cached:
+            _search_cache[key] = (time.monotonic() + self.cache_ttl, results)
+        return results
 
     def populate(self, session, request):
-        if self.url is None:
-            self.url = self.get_url(request)
-        self.session = session
+        state = {
+            'url': self.get_url(request),
+            'resolver': lookup_resolver(request, session),
+        }
+        if self.prefetch:
+            state['version'], dummy = self._prefetch_data(session)
+            state['prefetch_url'] = self._remote_url(request, v=state['version'])
+        set_widget_state(self, request, state)
+
+    def prefetch_labels(self, values, request):
+        """
+        Add ``values`` to the labels to load with the ``LookupResolver`` of
+        ``request``.
+        """
+        get_widget_state(self, request, 'resolver').add(self.model, self.label_field, values)
 
     def serialize(self, field, cstruct, **kw):
+        request = field_request(field)
         if cstruct in (null, None):
             cstruct = ''
             label = ''
         else:
-            obj = self.session.query(self.model).get(cstruct)
-            label = getattr(obj, kw.get('label_field', self.label_field))
+            resolver = get_widget_state(self, request, 'resolver')
+            label = resolver.label(
+                self.model, kw.get('label_field', self.label_field), cstruct)
+            if label is None:
+                label = ''
 
         kw['label'] = label
 
@@ -835,8 +1295,15 @@ class RelationSearchWidget(Widget):
 
         bloodhound_options = {
             'limit': kw.pop('limit', self.limit),
-            'remote': '%s?term=%%QUERY' % self.url
         }
+        if self.prefetch:
+            bloodhound_options['prefetch'] = {
+                'url': get_widget_state(self, request, 'prefetch_url'),
+                'thumbprint': get_widget_state(self, request, 'version'),
+            }
+        else:
+            bloodhound_options['remote'] = '%s?term=%%QUERY' % get_widget_state(
+                self, request, 'url')
         kw['bloodhound_options'] = json.dumps(bloodhound_options)
 
         typeahead_options = {
@@ -900,12 +1367,10 @@ class RecaptchaWidget(MappingWidget):
     readonly_template = 'recaptcha'
     url = "https://www.google.com/recaptcha/api/siteverify"
 
-    def populate(self, session, request):
-        self.request = request
-
     def serialize(self, field, cstruct, **kw):
+        request = field_request(field)
         kw.update({'public_key': self.public_key,
-                   'locale_name': self.request.locale_name})
+                   'locale_name': request.locale_name})
         return MappingWidget.serialize(self, field, cstruct, **kw)
 
     def deserialize(self, field, pstruct):
@@ -920,7 +1385,7 @@ class RecaptchaWidget(MappingWidget):
             raise Invalid(
                 field.schema,
                 _('Please verify that you are a human!'), pstruct)
-        remoteip = self.request.remote_addr
+        remoteip = field_request(field).remote_addr
         data = urllib.urlencode({'secret': self.private_key,
                                  'response': response,
                                  'remoteip': remoteip})
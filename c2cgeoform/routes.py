@@ -91,6 +91,8 @@ def includeme(config):
     config.add_directive('add_c2cgeoform_application', add_c2cgeoform_application)
     config.add_route_predicate('c2cgeoform_application', ApplicationRoutePredicate)
     config.add_request_method(get_application, 'c2cgeoform_application', reify=True)
+    # options of the relation widgets loaded remotely, see c2cgeoform.views.relations
+    config.add_route('c2cgeoform_relation', '/c2cgeoform_relation/{key}')
 
 
 def register_route(config, route, pattern):
@@ -113,6 +115,9 @@ def register_routes(config, multi_application=True):
     register_route(config, 'c2cgeoform_grid', '{}/grid.json'.format(base_route))
     register_route(config, 'c2cgeoform_map', '{}/map'.format(base_route))
     register_route(config, 'c2cgeoform_geojson', '{}/geojson.json'.format(base_route))
+    register_route(config, 'c2cgeoform_feature_info', '{}/feature_info.json'.format(base_route))
+    register_route(config, 'c2cgeoform_export', '{}/export.{{format}}'.format(base_route))
+    register_route(config, 'c2cgeoform_mvt', '{}/tiles/{{z}}/{{x}}/{{y}}.pbf'.format(base_route))
     register_route(config, 'c2cgeoform_item', '{}/{{id}}'.format(base_route))
     register_route(config, 'c2cgeoform_item_duplicate', '{}/{{id}}/duplicate'.format(base_route))
 
@@ -11,6 +11,7 @@ from pyramid.paster import (
 
 from pyramid.scripts.common import parse_vars
 
+from c2cgeoform.views.search import create_search_indexes, relation_search_index_ddl
 
 from ..models.meta import Base
 from ..models import (
@@ -28,6 +29,7 @@ from ..models.c2cgeoform_demo import (
     Situation,
     ContactPerson
     )
+from ..views.excavation import ExcavationViews
 
 
 def usage(argv):
@@ -60,6 +62,9 @@ def init_db(connection, force=False):
         connection.execute("CREATE SCHEMA \"{}\";".format(schema))
 
     Base.metadata.create_all(connection)
+    create_search_indexes(connection, [ExcavationViews])
+    for statement in relation_search_index_ddl(Address, 'label'):
+        connection.execute(statement)
 
     session_factory = get_session_factory(connection)
 
@@ -2,8 +2,6 @@ from pyramid.view import view_config
 from pyramid.view import view_defaults
 from functools import partial
 
-from sqlalchemy.orm import subqueryload
-
 import colander
 from c2cgeoform.schema import (
     GeoFormSchemaNode,
@@ -12,6 +10,7 @@ from c2cgeoform.schema import (
 )
 from c2cgeoform.ext.deform_ext import RelationCheckBoxListWidget
 from c2cgeoform.views.abstract_views import AbstractViews, ListField, ItemAction, UserMessage
+from c2cgeoform.views.search import TrigramSearch
 
 from ..models.c2cgeoform_demo import Excavation, Situation
 from ..i18n import _
@@ -44,6 +43,7 @@ class ExcavationViews(AbstractViews):
     _base_schema = base_schema
     _id_field = 'hash'
     _geometry_field = 'work_footprint'
+    _search_backend = TrigramSearch()
 
     _list_fields = [
         _list_field('reference_number'),
@@ -64,8 +64,7 @@ class ExcavationViews(AbstractViews):
 
     def _base_query(self):
         return super()._base_query().distinct(). \
-            outerjoin('situations'). \
-            options(subqueryload('situations'))
+            outerjoin('situations')
 
     @view_config(route_name='c2cgeoform_index',
                  renderer='../templates/index.jinja2')
@@ -84,6 +83,12 @@ class ExcavationViews(AbstractViews):
                 label=_('Map'),
                 css_class='btn btn-primary btn-map',
                 url=self._request.route_url('c2cgeoform_map')
+            ),
+            ItemAction(
+                name='action_export',
+                label=_('Export'),
+                css_class='btn btn-default btn-export c2cgeoform-export',
+                url=self._request.route_url('c2cgeoform_export', format='csv')
             )
         ]
 
@@ -107,13 +112,26 @@ class ExcavationViews(AbstractViews):
     @view_config(route_name='c2cgeoform_map',
                  renderer='../templates/map.jinja2')
     def map(self):
-        return super().map({})
+        return super().map({'bboxLoading': True})
 
     @view_config(route_name='c2cgeoform_geojson',
                  renderer='json')
     def geojson(self):
         return super().geojson()
 
+    @view_config(route_name='c2cgeoform_feature_info',
+                 renderer='json')
+    def feature_info(self):
+        return super().feature_info()
+
+    @view_config(route_name='c2cgeoform_mvt')
+    def mvt(self):
+        return super().mvt()
+
+    @view_config(route_name='c2cgeoform_export')
+    def export(self):
+        return super().export()
+
     @view_config(route_name='c2cgeoform_item',
                  request_method='GET',
                  renderer='../templates/edit.jinja2')
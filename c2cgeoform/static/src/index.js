@@ -3,12 +3,18 @@ import GeoJSONFormat from 'ol/format/GeoJSON'
 import Map from 'ol/Map'
 import VectorSource from 'ol/source/Vector'
 import View from 'ol/View'
+import { bbox as bboxStrategy } from 'ol/loadingstrategy'
+import { deserialize } from 'flatgeobuf/lib/mjs/ol'
 import { defaults } from 'ol/interaction'
 import proj4 from 'proj4'
 import { register } from 'ol/proj/proj4'
 import { addControls, addGeolocation } from './controls'
 import { addInteractions } from './interactions'
-import { createLayer, createVectorLayer } from './layers.js'
+import {
+  createLayer,
+  createVectorLayer,
+  createVectorTileLayer,
+} from './layers.js'
 import { getStyleFunction } from './styles'
 import { defaults as controlDefaults } from 'ol/control'
 
@@ -17,8 +23,12 @@ const widgets = {}
 let itemIcon
 
 export function initMap(target, options) {
-  const source = new VectorSource()
-  let vectorLayer = createVectorLayer(source)
+  const source = options.bboxLoading
+    ? createBboxSource(options)
+    : new VectorSource()
+  let vectorLayer = options.tilesUrl
+    ? createVectorTileLayer(options.tilesUrl)
+    : createVectorLayer(source)
   const context = { feature: null }
   vectorLayer.setStyle(getStyleFunction({ context }))
 
@@ -36,21 +46,30 @@ export function initMap(target, options) {
     map.getView().fit(options.view.initialExtent)
   }
 
-  if (options.url)
-    fetch(options.url)
-      .then(resp => resp.json())
-      .then(json => format.readFeatures(json))
-      .then(features => {
-        source.addFeatures(features)
-        if (options.fitSource) {
-          map.getView().fit(source.getExtent(), {
-            maxZoom: options.fitMaxZoom || 18,
-          })
-        }
-        if (options.onFeaturesLoaded) {
-          options.onFeaturesLoaded(features)
-        }
-      })
+  if (options.bboxLoading && (options.simplify || options.cluster)) {
+    // reload the simplified or clustered features when the zoom level changes
+    let zoom = Math.round(map.getView().getZoom())
+    map.getView().on('change:resolution', () => {
+      const newZoom = Math.round(map.getView().getZoom())
+      if (newZoom != zoom) {
+        zoom = newZoom
+        source.refresh()
+      }
+    })
+  }
+
+  if (options.url && !options.bboxLoading && !options.tilesUrl)
+    fetchFeatures(options.url, options).then(features => {
+      source.addFeatures(features)
+      if (options.fitSource) {
+        map.getView().fit(source.getExtent(), {
+          maxZoom: options.fitMaxZoom || 18,
+        })
+      }
+      if (options.onFeaturesLoaded) {
+        options.onFeaturesLoaded(features)
+      }
+    })
 
   // Change feature style on Hover
   map.on('pointermove', e => {
@@ -62,10 +81,82 @@ export function initMap(target, options) {
     vectorLayer.changed()
   })
 
+  // Complete the lightweight features with the values of all the list fields
+  // when they are clicked
+  if (options.featureInfoUrl && !options.tilesUrl) {
+    map.on('singleclick', e => {
+      let feature
+      map.forEachFeatureAtPixel(e.pixel, f => (feature = f), {
+        hitTolerance: 3,
+      })
+      if (!feature || feature.get('cluster')) return
+      fetchFeatureInfo(options, [feature.getId()]).then(features => {
+        if (features.length) feature.setProperties(features[0].properties)
+        if (options.onFeatureInfo) options.onFeatureInfo(feature)
+      })
+    })
+  }
+
   addGeolocation(map, options)
   return map
 }
 
+// Source loading only the features of the visible extent, features already
+// loaded are not added again as they are identified by their id.
+function createBboxSource(options) {
+  const source = new VectorSource({
+    strategy: bboxStrategy,
+    loader: (extent, resolution) => {
+      const url = new URL(options.url, window.location.href)
+      url.searchParams.set('bbox', extent.join(','))
+      if (options.simplify || options.cluster) {
+        url.searchParams.set('resolution', resolution)
+      }
+      fetchFeatures(url, options)
+        .then(features => {
+          source.addFeatures(features)
+          if (options.onFeaturesLoaded) {
+            options.onFeaturesLoaded(features)
+          }
+        })
+        .catch(() => source.removeLoadedExtent(extent))
+    },
+  })
+  return source
+}
+
+// Fetch the features as FlatGeobuf when the flatgeobuf option is set and the
+// server returns it (not for clusters), as GeoJSON otherwise.
+function fetchFeatures(url, options) {
+  const headers = options.flatgeobuf
+    ? { Accept: 'application/flatgeobuf, application/json;q=0.9' }
+    : {}
+  return fetch(url, { headers }).then(resp =>
+    resp.headers.get('Content-Type').startsWith('application/flatgeobuf')
+      ? readFlatGeobuf(resp)
+      : resp.json().then(json => format.readFeatures(json))
+  )
+}
+
+async function readFlatGeobuf(resp) {
+  const features = []
+  for await (const feature of deserialize(resp.body)) {
+    feature.setId(feature.get('_id_'))
+    features.push(feature)
+  }
+  return features
+}
+
+// Fetch the values of all the list fields of the features with the given ids,
+// when the map features only carry a minimal set of properties.
+export function fetchFeatureInfo(options, ids) {
+  const url = new URL(options.featureInfoUrl, window.location.href)
+  ids.forEach(id => url.searchParams.append('id', id))
+  return fetch(url)
+    .then(resp => resp.json())
+    .then(json => json.features)
+}
+
 export function initMapWidget(oid, options) {
   if (checkInitialized(oid)) return
   const geometry = options.geojson ? format.readGeometry(options.geojson) : null
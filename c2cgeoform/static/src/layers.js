@@ -2,6 +2,9 @@ import OSM from 'ol/source/OSM'
 import WMTS from 'ol/source/WMTS'
 import WMTSTileGrid from 'ol/tilegrid/WMTS'
 import VectorLayer from 'ol/layer/Vector'
+import VectorTileLayer from 'ol/layer/VectorTile'
+import VectorTileSource from 'ol/source/VectorTile'
+import MVT from 'ol/format/MVT'
 import TileLayer from 'ol/layer/Tile'
 import Image from 'ol/layer/Image'
 import XYZ from 'ol/source/XYZ'
@@ -37,3 +40,11 @@ export function createLayer(config) {
 export function createVectorLayer(source, style) {
   return new VectorLayer({ source, style })
 }
+
+export function createVectorTileLayer(url, style) {
+  const source = new VectorTileSource({
+    format: new MVT({ idProperty: '_id_' }),
+    url,
+  })
+  return new VectorTileLayer({ source, style })
+}
@@ -0,0 +1,100 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from c2cgeoform.cache import LRUCache, ResponseCache, bump_model_version, model_version, \
+    related_models, related_version
+from c2cgeoform.models import DBSession
+from c2cgeoform.tests import DatabaseTestCase
+from .models_test import Person, Phone, Tag
+
+
+class TestLRUCache(TestCase):
+
+    def test_get_missing(self):
+        cache = LRUCache()
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual('default', cache.get('key', 'default'))
+
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        self.assertEqual(2, len(cache))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+
+class TestResponseCache(TestCase):
+
+    def test_memory(self):
+        cache = ResponseCache(maxsize=1)
+        cache['a'] = ('application/json', b'{}')
+        self.assertEqual(('application/json', b'{}'), cache.get('a'))
+        cache['b'] = ('application/json', b'[]')
+        self.assertIsNone(cache.get('a'))
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(maxsize=1, directory=directory, disk_maxsize=2)
+            cache['a'] = ('application/json', b'{}\n')
+            cache['b'] = ('application/flatgeobuf', b'\x00\x01')
+            # evicted from memory, read from disk
+            self.assertEqual(('application/json', b'{}\n'), cache.get('a'))
+            self.assertEqual(('application/json', b'{}\n'),
+                             ResponseCache(directory=directory).get('a'))
+
+            os.utime(os.path.join(directory, 'a'), (0, 0))
+            cache['c'] = ('application/json', b'[]')
+            self.assertEqual(['b', 'c'], sorted(os.listdir(directory)))
+
+    def test_memory_expiry(self):
+        cache = ResponseCache(ttl=60)
+        with patch('c2cgeoform.cache.time.monotonic', return_value=1000):
+            cache['a'] = ('application/json', b'{}')
+        with patch('c2cgeoform.cache.time.monotonic', return_value=1059):
+            self.assertEqual(('application/json', b'{}'), cache.get('a'))
+        with patch('c2cgeoform.cache.time.monotonic', return_value=1060):
+            self.assertIsNone(cache.get('a'))
+
+    def test_disk_expiry(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with patch('c2cgeoform.cache.time.time', return_value=1000):
+                ResponseCache(directory=directory, ttl=60)['a'] = ('application/json', b'{}')
+            with patch('c2cgeoform.cache.time.time', return_value=1059):
+                self.assertEqual(('application/json', b'{}'),
+                                 ResponseCache(directory=directory).get('a'))
+            with patch('c2cgeoform.cache.time.time', return_value=1060):
+                self.assertIsNone(ResponseCache(directory=directory).get('a'))
+            self.assertEqual([], os.listdir(directory))
+
+
+class TestModelVersion(TestCase):
+
+    def test_bump_model_version(self):
+        version = model_version(Tag)
+        bump_model_version(Tag)
+        self.assertEqual(version + 1, model_version(Tag))
+
+    def test_related_models(self):
+        self.assertEqual({Person, Phone, Tag}, set(related_models(Person)))
+
+    def test_related_version(self):
+        version = related_version(Person)
+        bump_model_version(Tag)
+        self.assertEqual(version + 1, related_version(Person))
+
+
+class TestModelVersionFlush(DatabaseTestCase):
+
+    def test_flush_bumps_model_version(self):
+        person_version = model_version(Person)
+        tag_version = model_version(Tag)
+        DBSession.add(Person(name='Smith', first_name='Peter'))
+        DBSession.flush()
+        self.assertGreater(model_version(Person), person_version)
+        self.assertEqual(tag_version, model_version(Tag))
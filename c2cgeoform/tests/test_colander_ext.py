@@ -1,4 +1,5 @@
 from colander import (null, Invalid)
+from unittest import TestCase
 from geoalchemy2 import WKBElement
 from geoalchemy2.shape import to_shape, from_shape
 import json
@@ -6,6 +7,35 @@ import json
 from c2cgeoform.tests import DatabaseTestCase
 
 
+class TestReproject(TestCase):
+
+    def test_transformer_is_shared(self):
+        from c2cgeoform.ext.colander_ext import get_transformer
+        self.assertIs(get_transformer(4326, 3857), get_transformer(4326, 3857))
+        self.assertIsNot(get_transformer(4326, 3857), get_transformer(3857, 4326))
+
+    def test_reproject_multipolygon(self):
+        from c2cgeoform.ext.colander_ext import reproject
+        from shapely.geometry import MultiPolygon, Polygon
+
+        geometry = MultiPolygon([
+            Polygon([(0, 0), (1, 0), (1, 1), (0, 0)]),
+            Polygon([(1, 2), (2, 2), (2, 3), (1, 2)])])
+        projected = reproject(geometry, 4326, 3857)
+        self.assertEqual(len(geometry.geoms), len(projected.geoms))
+        self.assertAlmostEqual(111319.49079327231, projected.geoms[1].exterior.coords[0][0], 5)
+        self.assertAlmostEqual(222684.20850554455, projected.geoms[1].exterior.coords[0][1], 5)
+        self.assertTrue(reproject(projected, 3857, 4326).equals_exact(geometry, 1e-9))
+
+    def test_reproject_keeps_z(self):
+        from c2cgeoform.ext.colander_ext import reproject
+        from shapely.geometry import Point
+
+        projected = reproject(Point(1.0, 2.0, 5.0), 4326, 3857)
+        self.assertTrue(projected.has_z)
+        self.assertAlmostEqual(5.0, projected.z)
+
+
 class TestGeometry(DatabaseTestCase):
 
     def test_serialize_null(self):
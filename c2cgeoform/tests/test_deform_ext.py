@@ -1,5 +1,10 @@
+import json
 from colander import null
+from unittest import TestCase
+from unittest.mock import Mock, patch
+from pyramid import testing
 
+from c2cgeoform.ext.deform_ext import get_widget_state
 from c2cgeoform.tests import DatabaseTestCase
 from .models_test import EmploymentStatus, Person, Tag
 from c2cgeoform.models import DBSession
@@ -12,10 +17,11 @@ class TestRelationSelectWidget(DatabaseTestCase):
         widget = RelationSelectWidget(EmploymentStatus, 'id', 'name')
 
         renderer = DummyRenderer()
-        field = DummyField(None, renderer=renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = DummyField(None, renderer=renderer, request=request)
+        widget.populate(DBSession, request)
         widget.serialize(field, null)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
 
         first_value = renderer.kw['values'][0]
         self.assertEqual('0', first_value[0])
@@ -27,10 +33,11 @@ class TestRelationSelectWidget(DatabaseTestCase):
             EmploymentStatus, 'id', 'name', ('', '- Select -'))
 
         renderer = DummyRenderer()
-        field = DummyField(None, renderer=renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = DummyField(None, renderer=renderer, request=request)
+        widget.populate(DBSession, request)
         widget.serialize(field, null)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
 
         # first the default value
         first_value = renderer.kw['values'][0]
@@ -48,10 +55,11 @@ class TestRelationSelectWidget(DatabaseTestCase):
             EmploymentStatus, 'id', 'name', order_by='name')
 
         renderer = DummyRenderer()
-        field = DummyField(None, renderer=renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = DummyField(None, renderer=renderer, request=request)
+        widget.populate(DBSession, request)
         widget.serialize(field, null)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
 
         first_value = renderer.kw['values'][0]
         self.assertEqual('3', first_value[0])
@@ -66,10 +74,11 @@ class TestRelationSelect2Widget(DatabaseTestCase):
             EmploymentStatus, 'id', 'name', ('', '- Select -'))
 
         renderer = DummyRenderer()
-        field = DummyField(None, renderer=renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = DummyField(None, renderer=renderer, request=request)
+        widget.populate(DBSession, request)
         widget.serialize(field, null)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
 
         # first the default value
         first_value = renderer.kw['values'][0]
@@ -89,10 +98,11 @@ class TestRelationRadioChoiceWidget(DatabaseTestCase):
         widget = RelationRadioChoiceWidget(EmploymentStatus, 'id', 'name')
 
         renderer = DummyRenderer()
-        field = DummyField(None, renderer=renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = DummyField(None, renderer=renderer, request=request)
+        widget.populate(DBSession, request)
         widget.serialize(field, null)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
 
         # first the default value
         first_value = renderer.kw['values'][0]
@@ -107,10 +117,11 @@ class TestRelationCheckBoxListWidget(DatabaseTestCase):
         widget = RelationCheckBoxListWidget(Tag, 'id', 'name')
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         widget.serialize(field, null)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
         self.assertEqual(renderer.kw['cstruct'], [])
 
         first_value = renderer.kw['values'][0]
@@ -122,14 +133,15 @@ class TestRelationCheckBoxListWidget(DatabaseTestCase):
         widget = RelationCheckBoxListWidget(Tag, 'id', 'name')
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         objs = [
             {'id': '0'},
             {'id': '2'}]
 
         widget.serialize(field, objs)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
         self.assertEqual(renderer.kw['cstruct'], ['0', '2'])
 
         first_value = renderer.kw['values'][0]
@@ -142,8 +154,9 @@ class TestRelationCheckBoxListWidget(DatabaseTestCase):
             EmploymentStatus, 'id', 'name')
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         objs = [
             {'bad_column': '101'},
             {'bad_column': '102'}]
@@ -156,8 +169,9 @@ class TestRelationCheckBoxListWidget(DatabaseTestCase):
         widget = RelationCheckBoxListWidget(Tag, 'id', 'name')
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         result = widget.deserialize(field, null)
         self.assertEqual(result, [])
 
@@ -166,8 +180,9 @@ class TestRelationCheckBoxListWidget(DatabaseTestCase):
         widget = RelationCheckBoxListWidget(Tag, 'id', 'name')
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         result = widget.deserialize(field, ['1', '2'])
         self.assertEqual(
             result,
@@ -181,10 +196,11 @@ class TestRelationMultiSelect2Widget(DatabaseTestCase):
         widget = RelationSelect2Widget(Tag, 'id', 'name', multiple=True)
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         widget.serialize(field, null)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
         self.assertEqual(renderer.kw['cstruct'], [])
 
         first_value = renderer.kw['values'][0]
@@ -196,14 +212,15 @@ class TestRelationMultiSelect2Widget(DatabaseTestCase):
         widget = RelationSelect2Widget(Tag, 'id', 'name', multiple=True)
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         objs = [
             {'id': '0'},
             {'id': '2'}]
 
         widget.serialize(field, objs)
-        self.assertEqual(renderer.kw['values'], _convert_values(widget.values))
+        self.assertEqual(renderer.kw['values'], _convert_values(get_widget_state(widget, request, 'values')))
         self.assertEqual(renderer.kw['cstruct'], ['0', '2'])
 
         first_value = renderer.kw['values'][0]
@@ -216,8 +233,9 @@ class TestRelationMultiSelect2Widget(DatabaseTestCase):
             EmploymentStatus, 'id', 'name', multiple=True)
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         objs = [
             {'bad_column': '101'},
             {'bad_column': '102'}]
@@ -230,8 +248,9 @@ class TestRelationMultiSelect2Widget(DatabaseTestCase):
         widget = RelationSelect2Widget(Tag, 'id', 'name', multiple=True)
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         result = widget.deserialize(field, null)
         self.assertEqual(result, [])
 
@@ -240,22 +259,386 @@ class TestRelationMultiSelect2Widget(DatabaseTestCase):
         widget = RelationSelect2Widget(Tag, 'id', 'name', multiple=True)
         renderer = DummyRenderer()
 
-        field = _get_field('tags', renderer)
-        widget.populate(DBSession, None)
+        request = testing.DummyRequest()
+        field = _get_field('tags', renderer, request)
+        widget.populate(DBSession, request)
         result = widget.deserialize(field, ['1', '2'])
         self.assertEqual(
             result,
             [{'id': '1'}, {'id': '2'}])
 
 
+class TestRelationOptionsCache(TestCase):
+
+    def setUp(self):  # noqa
+        from c2cgeoform.ext.deform_ext import _options_cache
+        _options_cache.clear()
+
+    def _session(self):
+        session = Mock()
+        session.query.return_value.order_by.return_value = [(0, 'Worker'), (1, 'Employee')]
+        return session
+
+    def test_query_only_id_and_label(self):
+        from c2cgeoform.ext.deform_ext import RelationSelectWidget
+        widget = RelationSelectWidget(EmploymentStatus, 'id', 'name', ('', '- Select -'))
+        session = self._session()
+        request = testing.DummyRequest()
+        widget.populate(session, request)
+
+        session.query.assert_called_once_with(EmploymentStatus.id, EmploymentStatus.name)
+        self.assertEqual((('', '- Select -'), (0, 'Worker'), (1, 'Employee')),
+                         get_widget_state(widget, request, 'values'))
+
+    def test_cached(self):
+        from c2cgeoform.ext.deform_ext import (
+            RelationSelectWidget, RelationRadioChoiceWidget)
+        session = self._session()
+        request = testing.DummyRequest()
+        RelationSelectWidget(EmploymentStatus, 'id', 'name').populate(session, request)
+        widget = RelationRadioChoiceWidget(EmploymentStatus, 'id', 'name')
+        widget.populate(session, request)
+
+        self.assertEqual(1, session.query.call_count)
+        self.assertEqual(((0, 'Worker'), (1, 'Employee')),
+                         get_widget_state(widget, request, 'values'))
+
+        # other order and other locale
+        RelationSelectWidget(EmploymentStatus, 'id', 'name', order_by='name').populate(
+            session, request)
+        RelationSelectWidget(EmploymentStatus, 'id', 'name').populate(
+            session, testing.DummyRequest(locale_name='de'))
+        self.assertEqual(3, session.query.call_count)
+
+    def test_invalidated_by_model_version(self):
+        from c2cgeoform.cache import bump_model_version
+        from c2cgeoform.ext.deform_ext import RelationSelectWidget
+        widget = RelationSelectWidget(EmploymentStatus, 'id', 'name')
+        session = self._session()
+        widget.populate(session, testing.DummyRequest())
+        bump_model_version(EmploymentStatus)
+        widget.populate(session, testing.DummyRequest())
+        self.assertEqual(2, session.query.call_count)
+
+    def test_ttl(self):
+        from c2cgeoform.ext.deform_ext import RelationSelectWidget
+        widget = RelationSelectWidget(EmploymentStatus, 'id', 'name', cache_ttl=0)
+        session = self._session()
+        widget.populate(session, testing.DummyRequest())
+        widget.populate(session, testing.DummyRequest())
+        self.assertEqual(2, session.query.call_count)
+
+
+class TestWidgetState(TestCase):
+
+    def tearDown(self):  # noqa
+        testing.tearDown()
+
+    def test_request_scoped(self):
+        from c2cgeoform.ext.deform_ext import RelationSelectMapWidget
+        widget = RelationSelectMapWidget(lambda request: request.host_url + '/stops')
+        request1 = testing.DummyRequest(host_url='http://one')
+        request2 = testing.DummyRequest(host_url='http://two')
+        widget.populate(None, request1)
+        widget.populate(None, request2)
+
+        renderer = DummyRenderer()
+        widget.serialize(DummyField(None, renderer=renderer, request=request1), null)
+        self.assertIn('"http://one/stops"', renderer.kw['widget_config'])
+        widget.serialize(DummyField(None, renderer=renderer, request=request2), null)
+        self.assertIn('"http://two/stops"', renderer.kw['widget_config'])
+
+    def test_values(self):
+        from c2cgeoform.ext.deform_ext import RelationSelectWidget, _options_cache
+        _options_cache.clear()
+        widget = RelationSelectWidget(EmploymentStatus, 'id', 'name', cache_ttl=0)
+        session = Mock()
+        session.query.return_value.order_by.return_value = [(0, 'Worker')]
+        request = testing.DummyRequest()
+        widget.populate(session, request)
+
+        renderer = DummyRenderer()
+        widget.serialize(DummyField(None, renderer=renderer, request=request), null)
+        self.assertEqual([('0', 'Worker')], renderer.kw['values'])
+        # not populated for this request
+        widget.serialize(DummyField(None, renderer=renderer, request=testing.DummyRequest()), null)
+        self.assertEqual([], renderer.kw['values'])
+
+    def test_requires_request(self):
+        from c2cgeoform.ext.deform_ext import RelationSelectMapWidget
+        widget = RelationSelectMapWidget('/stops')
+        with self.assertRaises(ValueError):
+            widget.populate(None, None)
+        self.assertEqual('default', get_widget_state(widget, None, 'url', 'default'))
+
+    def test_field_request(self):
+        import colander
+        from c2cgeoform.ext.deform_ext import field_request
+        request = testing.DummyRequest()
+        self.assertIs(request, field_request(DummyField(request=request)))
+        schema = colander.SchemaNode(colander.String()).bind(request=request)
+        self.assertIs(request, field_request(DummyField(schema)))
+        self.assertIsNone(field_request(DummyField()))
+
+
+class TestLookupResolver(TestCase):
+
+    def _session(self):
+        session = Mock()
+        session.query.return_value.filter.return_value = [(1, 'Worker'), (3, 'Director')]
+        return session
+
+    def test_one_query_per_model(self):
+        from c2cgeoform.ext.deform_ext import LookupResolver
+        session = self._session()
+        resolver = LookupResolver(session)
+        resolver.add(EmploymentStatus, 'name', [1, '3', 4])
+
+        self.assertEqual('Worker', resolver.label(EmploymentStatus, 'name', '1'))
+        self.assertEqual('Director', resolver.label(EmploymentStatus, 'name', 3))
+        self.assertIsNone(resolver.label(EmploymentStatus, 'name', 4))
+        session.query.assert_called_once_with(EmploymentStatus.id, EmploymentStatus.name)
+
+    def test_not_prefetched(self):
+        from c2cgeoform.ext.deform_ext import LookupResolver
+        session = self._session()
+        resolver = LookupResolver(session)
+        self.assertEqual('Worker', resolver.label(EmploymentStatus, 'name', 1))
+        self.assertIsNone(resolver.label(EmploymentStatus, 'name', 5))
+        self.assertIsNone(resolver.label(EmploymentStatus, 'name', 5))
+        self.assertEqual(2, session.query.call_count)
+
+    def test_search_widget(self):
+        from c2cgeoform.ext.deform_ext import RelationSearchWidget
+        widget = RelationSearchWidget('/status', model=EmploymentStatus, label_field='name')
+        session = self._session()
+        request = testing.DummyRequest()
+        widget.populate(session, request)
+        widget.prefetch_labels([1], request)
+        widget.prefetch_labels([3], request)
+
+        renderer = DummyRenderer()
+        field = DummyField(None, renderer=renderer, request=request)
+        for id_, label in ((1, 'Worker'), (3, 'Director')):
+            widget.serialize(field, id_)
+            self.assertEqual(label, renderer.kw['label'])
+        self.assertEqual(1, session.query.call_count)
+
+
+class TestRemoteRelationSelect2Widget(TestCase):
+
+    def tearDown(self):  # noqa
+        testing.tearDown()
+
+    def _widget(self, **kw):
+        from c2cgeoform.ext.deform_ext import RelationSelect2Widget
+        return RelationSelect2Widget(EmploymentStatus, 'id', 'name', remote=True, **kw)
+
+    def test_key(self):
+        from c2cgeoform.ext.deform_ext import get_remote_widget
+        widget = self._widget()
+        self.assertIs(widget, get_remote_widget(widget.remote_key))
+        self.assertEqual(widget.remote_key, self._widget().remote_key)
+        self.assertNotEqual(widget.remote_key, self._widget(search_mode='trigram').remote_key)
+        self.assertIsNone(get_remote_widget('unknown'))
+
+    def test_serialize_selected_only(self):
+        widget = self._widget(default_value=('', '- Select -'))
+        session = Mock()
+        session.query.return_value.filter.return_value = [(3, 'Director')]
+        request = testing.DummyRequest()
+        request.route_url = Mock(return_value='http://example.com/c2cgeoform_relation/key')
+        widget.populate(session, request)
+        widget.prefetch_labels([3], request)
+
+        renderer = DummyRenderer()
+        field = DummyField(None, renderer=renderer, request=request)
+        widget.serialize(field, '3')
+        self.assertEqual('relation_select2', renderer.template)
+        self.assertEqual([('', '- Select -'), ('3', 'Director')], renderer.kw['values'])
+        self.assertEqual({
+            'ajax': {
+                'url': 'http://example.com/c2cgeoform_relation/key',
+                'dataType': 'json',
+                'delay': 250,
+            },
+            'minimumInputLength': 0,
+        }, json.loads(renderer.kw['select2_options']))
+        request.route_url.assert_called_once_with('c2cgeoform_relation', key=widget.remote_key)
+        session.query.assert_called_once_with(EmploymentStatus.id, EmploymentStatus.name)
+
+    def test_relation_view_not_found(self):
+        from pyramid.httpexceptions import HTTPNotFound
+        from c2cgeoform.views.relations import relation
+        with self.assertRaises(HTTPNotFound):
+            relation(testing.DummyRequest(matchdict={'key': 'unknown'}))
+
+    def test_relation_view_permission(self):
+        from pyramid.httpexceptions import HTTPForbidden
+        from pyramid.request import Request
+        config = testing.setUp(settings={'c2cgeoform.relation_permission': 'edit'})
+        config.testing_securitypolicy(userid='someone', permissive=False)
+        config.include('c2cgeoform.routes')
+        config.include('c2cgeoform.views')
+        app = config.make_wsgi_app()
+        with self.assertRaises(HTTPForbidden):
+            Request.blank('/c2cgeoform_relation/key').get_response(app)
+        testing.tearDown()
+
+
+class TestRelationSearchService(TestCase):
+
+    def setUp(self):  # noqa
+        from c2cgeoform.ext.deform_ext import _search_cache
+        _search_cache.clear()
+
+    def _request(self, term):
+        request = testing.DummyRequest(params={'term': term})
+        request.dbsession = Mock()
+        request.dbsession.query.return_value.filter.return_value.order_by.return_value. \
+            limit.return_value = [(3, 'Director')]
+        return request
+
+    def _widget(self):
+        from c2cgeoform.ext.deform_ext import RelationSearchWidget
+        return RelationSearchWidget(model=EmploymentStatus, label_field='name', limit=5)
+
+    def test_url(self):
+        widget = self._widget()
+        request = testing.DummyRequest()
+        request.route_url = Mock(return_value='http://example.com/c2cgeoform_relation/key')
+        self.assertEqual('http://example.com/c2cgeoform_relation/key', widget.get_url(request))
+        request.route_url.assert_called_once_with('c2cgeoform_relation', key=widget.remote_key, _query={})
+
+    def test_response(self):
+        request = self._request('Di')
+        self.assertEqual([{'id': 3, 'name': 'Director'}], self._widget().remote_response(request))
+        request.dbsession.query.assert_called_once_with(EmploymentStatus.id, EmploymentStatus.name)
+        request.dbsession.query.return_value.filter.return_value.order_by.return_value. \
+            limit.assert_called_once_with(5)
+
+    def test_missing_term(self):
+        from pyramid.httpexceptions import HTTPBadRequest
+        with self.assertRaises(HTTPBadRequest):
+            self._widget().remote_response(testing.DummyRequest())
+
+    def test_hot_prefix_cache(self):
+        from c2cgeoform.cache import bump_model_version
+        widget = self._widget()
+        request = self._request('Di')
+        widget.remote_response(request)
+        widget.remote_response(self._request(' di'))
+        widget.remote_response(request)
+        self.assertEqual(1, request.dbsession.query.call_count)
+
+        bump_model_version(EmploymentStatus)
+        widget.remote_response(request)
+        self.assertEqual(2, request.dbsession.query.call_count)
+
+        request = self._request('Direc')
+        widget.remote_response(request)
+        widget.remote_response(request)
+        self.assertEqual(2, request.dbsession.query.call_count)
+
+    def test_hot_prefix_cache_expires(self):
+        widget = self._widget()
+        request = self._request('di')
+        with patch('c2cgeoform.ext.deform_ext.time.monotonic', return_value=1000):
+            widget.remote_response(request)
+        with patch('c2cgeoform.ext.deform_ext.time.monotonic', return_value=1059):
+            widget.remote_response(request)
+        self.assertEqual(1, request.dbsession.query.call_count)
+        with patch('c2cgeoform.ext.deform_ext.time.monotonic', return_value=1060):
+            widget.remote_response(request)
+        self.assertEqual(2, request.dbsession.query.call_count)
+
+
+class TestRelationSearchPrefetch(TestCase):
+
+    def setUp(self):  # noqa
+        from c2cgeoform.ext.deform_ext import _prefetch_cache
+        _prefetch_cache.clear()
+
+    def tearDown(self):  # noqa
+        testing.tearDown()
+
+    def _session(self):
+        session = Mock()
+        session.query.return_value.order_by.return_value = [(0, 'Worker'), (3, 'Director')]
+        return session
+
+    def _widget(self):
+        from c2cgeoform.ext.deform_ext import RelationSearchWidget
+        return RelationSearchWidget(model=EmploymentStatus, label_field='name', prefetch=True)
+
+    def test_serialize(self):
+        widget = self._widget()
+        request = testing.DummyRequest()
+        request.route_url = Mock(return_value='http://example.com/data')
+        widget.populate(self._session(), request)
+        version, dummy = widget._prefetch_data(self._session())
+        request.route_url.assert_called_with(
+            'c2cgeoform_relation', key=widget.remote_key, _query={'v': version})
+
+        renderer = DummyRenderer()
+        widget.serialize(DummyField(None, renderer=renderer, request=request), null)
+        self.assertEqual({
+            'limit': 8,
+            'prefetch': {'url': 'http://example.com/data', 'thumbprint': version},
+        }, json.loads(renderer.kw['bloodhound_options']))
+
+    def _request(self, path, **kw):
+        from pyramid.request import Request
+        request = Request.blank(path, **kw)
+        request.registry = testing.setUp().registry
+        request.dbsession = self._session()
+        return request
+
+    def test_response(self):
+        widget = self._widget()
+        response = widget.remote_response(self._request('/'))
+        self.assertEqual(b'[[0,"Worker"],[3,"Director"]]', response.body)
+        self.assertEqual('no-cache', response.headers['Cache-Control'])
+        version = response.etag
+
+        response = widget.remote_response(self._request('/?v=' + version))
+        self.assertEqual('public, max-age=31536000, immutable', response.headers['Cache-Control'])
+
+        request = self._request('/?v=' + version, headers={'If-None-Match': '"%s"' % version})
+        self.assertEqual(304, widget.remote_response(request).status_int)
+        request.dbsession.query.assert_not_called()
+
+    def test_version_changes_with_data(self):
+        from c2cgeoform.cache import bump_model_version
+        widget = self._widget()
+        version, dummy = widget._prefetch_data(self._session())
+        session = self._session()
+        session.query.return_value.order_by.return_value = [(0, 'Worker')]
+        self.assertEqual(version, widget._prefetch_data(session)[0])
+        bump_model_version(EmploymentStatus)
+        self.assertNotEqual(version, widget._prefetch_data(session)[0])
+
+    def test_data_expires(self):
+        widget = self._widget()
+        session = self._session()
+        with patch('c2cgeoform.ext.deform_ext.time.monotonic', return_value=1000):
+            widget._prefetch_data(session)
+        with patch('c2cgeoform.ext.deform_ext.time.monotonic', return_value=1059):
+            widget._prefetch_data(session)
+        self.assertEqual(1, session.query.call_count)
+        with patch('c2cgeoform.ext.deform_ext.time.monotonic', return_value=1060):
+            widget._prefetch_data(session)
+        self.assertEqual(2, session.query.call_count)
+
+
 def _convert_values(values_tuple):
     return [(str(key), label) for (key, label) in values_tuple]
 
 
-def _get_field(name, renderer):
+def _get_field(name, renderer, request=None):
     from deform import Form
     from colanderalchemy import SQLAlchemySchemaNode
-    form = Form(SQLAlchemySchemaNode(Person), renderer=renderer)
+    form = Form(SQLAlchemySchemaNode(Person), renderer=renderer, request=request)
 
     for field in form.children:
         if field.name == name:
@@ -290,10 +673,11 @@ class DummyField(object):
     required = True
     cstruct = null
 
-    def __init__(self, schema=None, renderer=None, translations=None):
+    def __init__(self, schema=None, renderer=None, translations=None, request=None):
         self.schema = schema
         self.renderer = renderer
         self.translations = translations
+        self.request = request
 
     def clone(self):
         self.cloned = True
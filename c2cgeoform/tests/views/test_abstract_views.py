@@ -1,16 +1,31 @@
-from itertools import groupby
+import json
+import time
+from collections import namedtuple
+from datetime import date
+from geoalchemy2 import Geometry
+from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.httpexceptions import HTTPNotFound
 from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid import testing
+from pyramid.request import Request
+from pyramid.threadlocal import get_current_registry
 from unittest import TestCase
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 from functools import partial
 from bs4 import BeautifulSoup
+from sqlalchemy import Column, Date, Integer, String, create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
 
+from c2cgeoform.cache import ResponseCache, bump_model_version
 from c2cgeoform.models import DBSession
 from c2cgeoform.tests import DatabaseTestCase
 from c2cgeoform.tests.models_test import Person, Tag
 from c2cgeoform.schema import GeoFormSchemaNode
-from c2cgeoform.views.abstract_views import AbstractViews, ListField
+from c2cgeoform.views.abstract_views import AbstractViews, ListField, tile_bounds
+from c2cgeoform.views.search import FullTextSearch
 
 
 _list_field = partial(ListField, Person)
@@ -26,6 +41,73 @@ class TestListField(TestCase):
         self.assertEqual('id', ListField(Tag, 'id').label())
 
 
+class TestGridColumns(TestCase):
+
+    def test_projection_is_opt_in(self):
+        self.assertIsNone(ConcreteViews(Mock())._grid_columns())
+
+    def test_column_backed_list_fields(self):
+        views = ProjectedViews(Mock())
+        self.assertEqual(['id', 'name', 'first_name'],
+                         [column.key for column in views._grid_columns()])
+
+    def test_columns_are_labeled_by_field_id(self):
+        class TagNameViews(ProjectedViews):
+            _list_fields = [
+                _list_field('name'),
+                ListField(Tag, 'name', key='tag_name')]
+
+        views = TagNameViews(Mock())
+        columns = views._grid_columns()
+        self.assertEqual(['id', 'name', 'tag_name'], [column.key for column in columns])
+        row = namedtuple('Row', ['id', 'name', 'tag_name'])(1, 'Smith', 'red')
+        self.assertEqual(['Smith', 'red'], [field.value(row) for field in views._list_fields])
+
+    def test_clashing_labels_need_entities(self):
+        class ClashViews(ProjectedViews):
+            _list_fields = [
+                _list_field('name'),
+                ListField(Tag, 'name')]
+
+        self.assertIsNone(ClashViews(Mock())._grid_columns())
+
+    def test_renderer_with_declared_columns(self):
+        class DeclaredColumnsViews(ProjectedViews):
+            _list_fields = [
+                _list_field('name',
+                            renderer=lambda person: '{} {}'.format(person.first_name, person.name),
+                            columns=[Person.first_name, Person.name])]
+
+        views = DeclaredColumnsViews(Mock())
+        self.assertEqual(['id', 'first_name', 'name'],
+                         [column.key for column in views._grid_columns()])
+
+    def test_renderer_needs_entities(self):
+        class RendererViews(ProjectedViews):
+            _list_fields = [
+                _list_field('tags', renderer=lambda person: ', '.join(t.name for t in person.tags))]
+
+        self.assertIsNone(RendererViews(Mock())._grid_columns())
+
+
+class TestEagerLoadOptions(TestCase):
+
+    def test_column_backed_list_fields(self):
+        self.assertEqual([], ConcreteViews(Mock())._eager_load_options())
+
+    def test_relationships_are_inferred_and_declared(self):
+        class RelationshipViews(ConcreteViews):
+            _list_fields = [
+                _list_field('tags', renderer=lambda person: ', '.join(t.name for t in person.tags)),
+                _list_field('name',
+                            renderer=lambda person: ', '.join(p.number for p in person.phones),
+                            relationships=[Person.phones, (Person.tags,)])]
+
+        options = RelationshipViews(Mock())._eager_load_options()
+        self.assertEqual([('tags',), ('phones',)],
+                         [tuple(attr.key for attr in option.path) for option in options])
+
+
 class ConcreteViews(AbstractViews):
 
     _model = Person
@@ -36,6 +118,464 @@ class ConcreteViews(AbstractViews):
     _base_schema = GeoFormSchemaNode(Person, title='Person')
 
 
+class ProjectedViews(ConcreteViews):
+
+    _grid_column_projection = True
+
+
+class KeysetViews(ConcreteViews):
+
+    _pagination = 'keyset'
+
+
+class TestItemUrl(TestCase):
+
+    def tearDown(self):  # noqa
+        testing.tearDown()
+
+    def test_quoted_like_route_url(self):
+        config = testing.setUp()
+        config.add_route('c2cgeoform_item', '/persons/{id}')
+        request = testing.DummyRequest()
+        views = ConcreteViews(request)
+        for id_ in (1, 'b?c', 'd e#f'):
+            self.assertEqual(request.route_url('c2cgeoform_item', id=id_),
+                             views._item_url('c2cgeoform_item', id_))
+        # the id stays one path segment
+        self.assertEqual(request.route_url('c2cgeoform_item', id='ID').replace('ID', 'a%2Fb%3Fc'),
+                         views._item_url('c2cgeoform_item', 'a/b?c'))
+
+
+class TestKeysetCursor(TestCase):
+
+    def test_cursor_round_trip(self):
+        views = KeysetViews(Mock())
+        cursor = views._encode_cursor('smi', 'name', 'desc', ['Smith', 1])
+        self.assertEqual(['Smith', 1], views._decode_cursor(cursor, 'smi', 'name', 'desc', 2))
+
+    def test_cursor_for_another_sort_is_ignored(self):
+        views = KeysetViews(Mock())
+        cursor = views._encode_cursor('', 'name', 'desc', ['Smith', 1])
+        self.assertIsNone(views._decode_cursor(cursor, '', 'first_name', 'desc', 2))
+        self.assertIsNone(views._decode_cursor(cursor, '', 'name', 'asc', 2))
+
+    def test_cursor_for_another_search_is_ignored(self):
+        views = KeysetViews(Mock())
+        cursor = views._encode_cursor('smi', 'name', 'desc', ['Smith', 1])
+        self.assertIsNone(views._decode_cursor(cursor, 'smith', 'name', 'desc', 2))
+        self.assertIsNone(views._decode_cursor(cursor, '', 'name', 'desc', 2))
+
+    def test_invalid_cursor_is_ignored(self):
+        views = KeysetViews(Mock())
+        self.assertIsNone(views._decode_cursor('not a cursor', '', 'name', 'asc', 2))
+
+
+class TestGridTotal(TestCase):
+
+    def _views(self):
+        views = ConcreteViews(Mock())
+        views._total_count = 'cached'
+        views._query_key = Mock(return_value=('SELECT', '[]'))
+        return views
+
+    def test_cached_total_expires(self):
+        from c2cgeoform.views.abstract_views import _totals_cache
+        _totals_cache.clear()
+        query = Mock()
+        query.count.return_value = 3
+        views = self._views()
+        self.assertEqual((3, False), views._grid_total(query))
+        self.assertEqual((3, False), views._grid_total(query))
+        self.assertEqual(1, query.count.call_count)
+
+        query.count.return_value = 4
+        with patch('c2cgeoform.views.abstract_views.time.monotonic',
+                   return_value=time.monotonic() + views._total_cache_ttl + 1):
+            self.assertEqual((4, False), views._grid_total(query))
+        self.assertEqual(2, query.count.call_count)
+
+    def test_explain_binds_parameters(self):
+        from c2cgeoform.views.abstract_views import Explain
+        query = Session().query(Person).filter(Person.name.ilike('%a:b%'))
+        compiled = Explain(query.statement).compile(dialect=postgresql.dialect())
+        self.assertTrue(str(compiled).startswith('EXPLAIN (FORMAT JSON) SELECT '))
+        self.assertIn('ILIKE %(name_1)s', str(compiled))
+        self.assertEqual({'name_1': '%a:b%'}, compiled.params)
+
+
+class TestExport(TestCase):
+
+    def _rows(self):
+        return iter([['Smith', 'Peter'], ['Wayne', None], ['Élda', '2020-01-02']])
+
+    def test_csv(self):
+        views = ConcreteViews(Mock())
+        content = b''.join(views._csv_iter(['Name', 'First name'], self._rows()))
+        self.assertEqual(
+            'Name,First name\r\nSmith,Peter\r\nWayne,\r\nÉlda,2020-01-02\r\n',
+            content.decode('utf-8'))
+
+    def test_csv_batches(self):
+        views = ConcreteViews(Mock())
+        views._export_batch_size = 2
+        self.assertEqual(2, len(list(views._csv_iter(['Name', 'First name'], self._rows()))))
+
+    def test_xlsx(self):
+        views = ConcreteViews(Mock())
+        content = b''.join(views._xlsx_iter(['Name', 'First name'], self._rows()))
+        self.assertEqual(b'PK', content[:2])
+
+    def test_unknown_format(self):
+        request = Mock(matchdict={'table': 'persons', 'format': 'pdf'})
+        with self.assertRaises(HTTPNotFound):
+            ConcreteViews(request).export()
+
+
+class TestConditionalGet(TestCase):
+
+    def setUp(self):  # noqa
+        testing.setUp()
+
+    def tearDown(self):  # noqa
+        testing.tearDown()
+
+    def _views(self, etag=None):
+        headers = {} if etag is None else {'If-None-Match': '"{}"'.format(etag)}
+        request = Request.blank('/persons/grid.json?limit=10', headers=headers)
+        request.registry = get_current_registry()
+        request.matched_route = Mock()
+        request.matched_route.name = 'c2cgeoform_grid'
+        request.matchdict = {'table': 'persons'}
+        views = ConcreteViews(request)
+        views._conditional_get = True
+        return views
+
+    def test_disabled(self):
+        views = self._views()
+        views._conditional_get = False
+        self.assertIsNone(views._not_modified())
+        self.assertIsNone(views._request.response.etag)
+
+    def test_not_modified(self):
+        views = self._views()
+        self.assertIsNone(views._not_modified())
+        etag = views._request.response.etag
+        self.assertIsNotNone(etag)
+
+        response = self._views(etag)._not_modified()
+        self.assertIsInstance(response, HTTPNotModified)
+        self.assertEqual(etag, response.etag)
+
+    def test_geojson_cache(self):
+        views = self._views()
+        views._geojson_cache = ResponseCache()
+
+        def geojson_response():
+            views._request.response.content_type = 'application/json'
+            views._request.response.body = b'{"type": "FeatureCollection", "features": []}'
+            return views._request.response
+
+        views._geojson_response = Mock(side_effect=geojson_response)
+        views.geojson()
+
+        cached_views = self._views()
+        cached_views._geojson_cache = views._geojson_cache
+        cached_views._geojson_response = Mock()
+        response = cached_views.geojson()
+        cached_views._geojson_response.assert_not_called()
+        self.assertEqual(b'{"type": "FeatureCollection", "features": []}', response.body)
+
+        bump_model_version(Tag)
+        views._request = self._views()._request
+        views.geojson()
+        self.assertEqual(2, views._geojson_response.call_count)
+
+    def test_etag_is_per_process(self):
+        etag = self._views()._etag()
+        with patch('c2cgeoform.views.abstract_views.boot_token', 'other process'):
+            self.assertNotEqual(etag, self._views()._etag())
+
+    def test_related_model_change(self):
+        views = self._views()
+        views._not_modified()
+        etag = views._request.response.etag
+
+        bump_model_version(Tag)
+        self.assertIsNone(self._views(etag)._not_modified())
+
+
+GeoBase = declarative_base()
+
+
+class Place(GeoBase):
+    __tablename__ = 'place'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    created = Column(Date)
+    geom = Column(Geometry('POINT', srid=2056))
+
+
+class PlaceViews(AbstractViews):
+
+    _model = Place
+    _id_field = 'id'
+    _geometry_field = 'geom'
+    _list_fields = [
+        ListField(Place, 'name'),
+        ListField(Place, 'created'),
+        ListField(Place, 'id', key='label', renderer=lambda place: 'Place {}'.format(place.id)),
+        ListField(Place, 'geom')]
+
+
+class TestBboxQuery(TestCase):
+
+    def _sql(self, bbox, srid):
+        views = PlaceViews(Mock())
+        query = views._bbox_query(Session().query(Place), bbox, srid)
+        return str(query.statement.compile(dialect=postgresql.dialect()))
+
+    def test_envelope_is_transformed(self):
+        sql = self._sql('600000,200000,601000,201000', 3857)
+        self.assertIn('place.geom && ST_Transform(ST_MakeEnvelope(', sql)
+
+    def test_envelope_in_geometry_srid(self):
+        sql = self._sql('600000,200000,601000,201000', 2056)
+        self.assertIn('place.geom && ST_MakeEnvelope(', sql)
+
+    def test_invalid_bbox(self):
+        with self.assertRaises(HTTPBadRequest):
+            self._sql('600000,200000', 2056)
+
+
+class TestGeoJSON(TestCase):
+
+    def _views(self, **params):
+        request = Mock(dbsession=Session(), params=params)
+        return PlaceViews(request)
+
+    def test_geometry_serialized_by_database(self):
+        query = self._views()._geojson_query(3857)
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+        self.assertIn(
+            'ST_AsGeoJSON(ST_Transform(place.geom, %(ST_Transform_1)s), %(ST_AsGeoJSON_1)s) AS _geometry',
+            sql)
+
+    def test_features(self):
+        views = self._views()
+        place = Place(id=1, name='Bern', created=date(2020, 1, 2))
+        features = list(views._geojson_features([
+            (place, '{"type":"Point","coordinates":[1,2]}'),
+            (Place(id=2), None)]))
+        self.assertEqual({
+            'type': 'Feature',
+            'id': 1,
+            'geometry': {'type': 'Point', 'coordinates': [1, 2]},
+            'properties': {'name': 'Bern', 'created': '2020-01-02', 'label': 'Place 1', 'geom': ''}
+        }, json.loads(features[0]))
+        self.assertIsNone(json.loads(features[1])['geometry'])
+
+    def test_geojson_fields(self):
+        views = self._views()
+        views._grid_column_projection = True
+        views._geojson_fields = ['name']
+        sql = str(views._geojson_query(3857).statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('SELECT place.id AS id, place.name AS name, ST_AsGeoJSON(', sql)
+        row = namedtuple('Row', ['id', 'name', 'geometry'])
+        features = list(views._geojson_features([row(1, 'Bern', None)]))
+        self.assertEqual({'name': 'Bern'}, json.loads(features[0])['properties'])
+
+    def test_geojson_id_and_geometry_only(self):
+        views = self._views()
+        views._grid_column_projection = True
+        views._geojson_fields = []
+        sql = str(views._geojson_query(3857).statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('SELECT place.id AS id, ST_AsGeoJSON(', sql)
+
+    def test_feature_info_ids(self):
+        request = Request.blank('/places/feature_info.json?id=1,2&id=3')
+        request.dbsession = Mock()
+        views = PlaceViews(request)
+        views._base_query = Mock()
+        views._base_query.return_value.filter.return_value = [Place(id=1, name='Bern')]
+        self.assertEqual(
+            [{'id': 1, 'properties': {'name': 'Bern', 'created': '', 'label': 'Place 1', 'geom': ''}}],
+            views.feature_info()['features'])
+        in_ = views._base_query.return_value.filter.call_args[0][0]
+        self.assertEqual([1, 2, 3], [bind.value for bind in in_.right.element.clauses])
+
+    def test_feature_info_invalid_ids(self):
+        request = Request.blank('/places/feature_info.json?id=1,abc')
+        views = PlaceViews(request)
+        views._base_query = Mock()
+        with self.assertRaises(HTTPBadRequest):
+            views.feature_info()
+        views._base_query.assert_not_called()
+
+    def test_feature_info_too_many_ids(self):
+        request = Request.blank('/places/feature_info.json?id=1,2,3')
+        views = PlaceViews(request)
+        views._feature_info_max_ids = 2
+        with self.assertRaises(HTTPBadRequest):
+            views.feature_info()
+
+    def test_simplified_for_resolution(self):
+        views = self._views(resolution='10')
+        sql = str(views._geojson_query(3857).statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('ST_SimplifyPreserveTopology(ST_Transform(place.geom, ', sql)
+
+    def test_resolution(self):
+        self.assertIsNone(self._views()._geojson_resolution(3857))
+        self.assertEqual(2.5, self._views(resolution='2.5')._geojson_resolution(2056))
+        self.assertAlmostEqual(156543.03392804097, self._views(zoom='0')._geojson_resolution(3857))
+        for params in ({'resolution': '-1'}, {'resolution': 'x'}, {'zoom': '5'}):
+            with self.assertRaises(HTTPBadRequest):
+                self._views(**params)._geojson_resolution(2056)
+
+    def test_decimal_digits(self):
+        views = self._views()
+        self.assertEqual(9, views._geojson_decimal_digits(3857))
+        self.assertEqual(0, views._geojson_decimal_digits(3857, 150))
+        self.assertEqual(2, views._geojson_decimal_digits(3857, 0.15))
+        views._geojson_srid_decimal_digits = {2056: 2}
+        self.assertEqual(2, views._geojson_decimal_digits(2056))
+        self.assertEqual(2, views._geojson_decimal_digits(2056, 0.001))
+
+    def test_flatgeobuf_query(self):
+        views = self._views()
+        sql = str(views._flatgeobuf_query(3857).statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('SELECT ST_AsFlatGeobuf(features, ', sql)
+        self.assertIn('place.id AS _id_, place.name AS name, CAST(place.created AS VARCHAR) AS created', sql)
+        self.assertIn('place.geom IS NOT NULL', sql)
+
+    def test_flatgeobuf_fields(self):
+        views = self._views()
+        views._geojson_fields = ['name']
+        sql = str(views._flatgeobuf_query(3857).statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('place.id AS _id_, place.name AS name, ST_', sql)
+
+    def test_accepts_flatgeobuf(self):
+        for accept, expected in (
+                ('application/flatgeobuf', True),
+                ('application/flatgeobuf, application/json;q=0.5', True),
+                ('*/*', False),
+                ('application/json', False)):
+            request = Request.blank('/places/geojson.json', headers={'Accept': accept})
+            self.assertEqual(expected, PlaceViews(request)._accepts_flatgeobuf(), accept)
+
+    def test_cluster_size(self):
+        views = self._views()
+        self.assertIsNone(views._cluster_size(100))
+        views._cluster_max_zoom = 12
+        self.assertIsNone(views._cluster_size(None))
+        resolution = 2 * 20037508.342789244 / 256 / 2 ** 12
+        self.assertEqual(resolution * 60, views._cluster_size(resolution))
+        self.assertIsNone(views._cluster_size(resolution / 2))
+
+    def test_cluster_query(self):
+        views = self._views(bbox='0,0,1000,1000')
+        sql = str(views._cluster_query(3857, 100).statement.compile(dialect=postgresql.dialect()))
+        self.assertIn('count(*) AS _count', sql)
+        self.assertIn('GROUP BY ST_SnapToGrid(ST_Centroid(ST_Transform(place.geom, ', sql)
+        self.assertIn('HAVING ST_SnapToGrid(', sql)
+        self.assertIn('place.id IN (SELECT place.id', sql)
+
+    def test_cluster_features(self):
+        features = list(self._views()._cluster_features([
+            ('POINT(100 200)', 3, '{"type":"Point","coordinates":[110,190]}')]))
+        self.assertEqual({
+            'type': 'Feature',
+            'id': 'cluster:POINT(100 200)',
+            'geometry': {'type': 'Point', 'coordinates': [110, 190]},
+            'properties': {'cluster': True, 'count': 3}
+        }, json.loads(features[0]))
+
+    def test_streamed_feature_collection(self):
+        views = self._views()
+        views._geojson_batch_size = 1
+        chunks = list(views._geojson_iter(views._geojson_features(iter([
+            (Place(id=1), '{"type":"Point","coordinates":[1,2]}'),
+            (Place(id=2), None)]))))
+        self.assertEqual(4, len(chunks))
+        collection = json.loads(b''.join(chunks).decode('utf-8'))
+        self.assertEqual('FeatureCollection', collection['type'])
+        self.assertEqual([1, 2], [feature['id'] for feature in collection['features']])
+
+    def test_empty_streamed_feature_collection(self):
+        collection = json.loads(b''.join(self._views()._geojson_iter(iter([]))).decode('utf-8'))
+        self.assertEqual([], collection['features'])
+
+    def test_stream_session_uses_model_bind(self):
+        engine = create_engine('sqlite://')
+        query = Mock(session=Session(binds={Place: engine}, expire_on_commit=False))
+        query.with_session.return_value.yield_per.return_value = iter([Place(id=1)])
+        self.assertEqual(1, len(list(self._views()._stream_query(query, 10))))
+        session = query.with_session.call_args[0][0]
+        self.assertIs(engine, session.bind)
+        self.assertFalse(session.expire_on_commit)
+
+
+class TestVectorTiles(TestCase):
+
+    def test_tile_bounds(self):
+        half = 20037508.342789244
+        self.assertEqual((-half, -half, half, half), tile_bounds(0, 0, 0))
+        self.assertEqual((0, 0, half, half), tile_bounds(1, 1, 0))
+
+    def test_tile_columns(self):
+        self.assertEqual(['name', 'created'],
+                         [column.key for column in PlaceViews(Mock())._tile_columns()])
+
+    def test_tile_properties(self):
+        views = PlaceViews(Mock())
+        views._tile_properties = ['created']
+        self.assertEqual(['created'], [column.key for column in views._tile_columns()])
+
+    def test_tile_query(self):
+        views = PlaceViews(Mock(dbsession=Session()))
+        compiled = views._tile_query(1, 1, 0).statement.compile(dialect=postgresql.dialect())
+        sql = str(compiled)
+        self.assertIn('ST_AsMVT(tile, ', sql)
+        self.assertIn('ST_AsMVTGeom(ST_Transform(place.geom, ', sql)
+        self.assertIn('CAST(place.created AS VARCHAR) AS created', sql)
+        self.assertIn('place.geom && ST_Transform(ST_Expand(ST_MakeEnvelope(', sql)
+        # the 64 pixels buffer of a 4096 pixels tile, in meters
+        self.assertIn(20037508.342789244 * 64 / 4096, compiled.params.values())
+
+    def test_tile_out_of_range(self):
+        request = Mock(matchdict={'z': '1', 'x': '2', 'y': '0'})
+        with self.assertRaises(HTTPNotFound):
+            PlaceViews(request).mvt()
+
+    def test_tiles_url(self):
+        request = Mock()
+        request.route_url.return_value = 'http://example.com/places/tiles/%7Bz%7D/%7Bx%7D/%7By%7D.pbf'
+        self.assertEqual('http://example.com/places/tiles/{z}/{x}/{y}.pbf',
+                         PlaceViews(request)._tiles_url())
+
+
+class TestPrefetchWidgets(TestCase):
+
+    def test_prefetch_sequence_items(self):
+        import colander
+
+        widget = Mock()
+        schema = colander.SchemaNode(colander.Mapping())
+        schema.add(colander.SchemaNode(colander.Integer(), name='name'))
+        items = colander.SchemaNode(colander.Sequence(), name='items')
+        item = colander.SchemaNode(colander.Mapping(), name='item')
+        item.add(colander.SchemaNode(colander.Integer(), name='address_id', widget=widget))
+        items.add(item)
+        schema.add(items)
+
+        request = Mock()
+        PlaceViews(request)._prefetch_widgets(schema, {
+            'name': 'test',
+            'items': [{'address_id': 1}, {'address_id': colander.null}, {'address_id': 3}],
+        })
+        self.assertEqual([((([1], request), {})), (([3], request), {})],
+                         [tuple(call) for call in widget.prefetch_labels.call_args_list])
+
+
 class TestAbstractViews(DatabaseTestCase):
 
     def _add_test_persons(self):
@@ -87,12 +627,25 @@ class TestAbstractViews(DatabaseTestCase):
         self.assertTrue('_id_' in rows[0])
         self.assertEquals('Smith', rows[0]['name'])
         self.assertEquals('person/1', rows[0]['actions']['dblclick'])
-        call_list = self.request.route_url.call_args_list
-        idx = [call[1]['id'] for call in call_list]
-        grouped_by_id = [len(list(cgen)) for dummy, cgen in groupby(idx)]
-        grouped_by_count = [len(list(cgen)) for dummy, cgen in groupby(grouped_by_id)]
-        self.assertEquals(1, len(grouped_by_count))
-        self.assertEquals(5, grouped_by_count[0])
+        # item routes are generated once, whatever the number of rows
+        route_names = [call[0][0] for call in self.request.route_url.call_args_list]
+        self.assertEqual(sorted(set(route_names)), sorted(route_names))
+
+    def test_grid_item_urls(self):
+        self.request.route_url = Mock(side_effect=lambda route_name, **kw: '{}/{}'.format(
+            route_name, kw['id']))
+        self._add_test_persons()
+        self.request.params['limit'] = '1'
+
+        response = ConcreteViews(self.request).grid()
+
+        row = response['rows'][0]
+        self.assertEqual('c2cgeoform_item/{}'.format(self.person1.id), row['actions']['dblclick'])
+        self.assertEqual(
+            ['c2cgeoform_item/{}'.format(self.person1.id),
+             'c2cgeoform_item_duplicate/{}'.format(self.person1.id),
+             'c2cgeoform_item/{}'.format(self.person1.id)],
+            [action['url'] for action in row['actions']['dropdown']])
 
     def test_grid_without_parameters(self):
         self.request.route_url = Mock(return_value='person/1')
@@ -110,6 +663,90 @@ class TestAbstractViews(DatabaseTestCase):
         response = views.grid()
         self.assertEquals(22, response['total'])
 
+    def test_grid_keyset(self):
+        self.request.route_url = Mock(return_value='person/1')
+        self._add_test_persons()
+        self.request.params['limit'] = '5'
+        self.request.params['sort'] = 'name'
+        self.request.params['order'] = 'desc'
+
+        response = KeysetViews(self.request).grid()
+        self.assertEqual(22, response['total'])
+        self.assertEqual(['Wayne', 'Venetta', 'Vada', 'Sulema', 'Smith'],
+                         [row['name'] for row in response['rows']])
+        self.assertIsNotNone(response['cursor'])
+
+        self.request.params['cursor'] = response['cursor']
+        response = KeysetViews(self.request).grid()
+        self.assertEqual(['Sharee', 'Odis', 'Monte', 'Lesha', 'Lashawna'],
+                         [row['name'] for row in response['rows']])
+
+    def test_grid_keyset_last_page(self):
+        self.request.route_url = Mock(return_value='person/1')
+        self._add_test_persons()
+        self.request.params['offset'] = '20'
+        self.request.params['limit'] = '5'
+
+        response = KeysetViews(self.request).grid()
+        self.assertEqual(2, len(response['rows']))
+        self.assertIsNone(response['cursor'])
+
+    def test_grid_cached_total(self):
+        self.request.route_url = Mock(return_value='person/1')
+        self._add_test_persons()
+
+        class CachedTotalViews(ConcreteViews):
+            _total_count = 'cached'
+
+        response = CachedTotalViews(self.request).grid()
+        self.assertEqual(22, response['total'])
+        self.assertFalse(response['total_approximate'])
+
+        DBSession.add(Person(name="Smith", first_name="John"))
+        DBSession.flush()
+        response = CachedTotalViews(self.request).grid()
+        self.assertEqual(23, response['total'])
+
+    def test_grid_estimated_total(self):
+        self.request.route_url = Mock(return_value='person/1')
+        self._add_test_persons()
+
+        class EstimatedTotalViews(ConcreteViews):
+            _total_count = 'estimated'
+            _total_estimate_threshold = 0
+
+        response = EstimatedTotalViews(self.request).grid()
+        self.assertTrue(response['total_approximate'])
+
+        EstimatedTotalViews._total_estimate_threshold = 1000000
+        response = EstimatedTotalViews(self.request).grid()
+        self.assertEqual(22, response['total'])
+        self.assertFalse(response['total_approximate'])
+
+    def test_grid_search(self):
+        self.request.route_url = Mock(return_value='person/1')
+        self._add_test_persons()
+        self.request.params['search'] = 'lash'
+
+        response = ConcreteViews(self.request).grid()
+        self.assertEqual(['Lashaun', 'Lashawna'], sorted(row['name'] for row in response['rows']))
+
+    def test_grid_full_text_search(self):
+        self.request.route_url = Mock(return_value='person/1')
+        self._add_test_persons()
+
+        class FullTextViews(ConcreteViews):
+            _search_backend = FullTextSearch(rank=True)
+
+        self.request.params['search'] = 'peter smith'
+        response = FullTextViews(self.request).grid()
+        self.assertEqual(1, response['total'])
+        self.assertEqual('Smith', response['rows'][0]['name'])
+
+        self.request.params['search'] = 'peter -smith'
+        response = FullTextViews(self.request).grid()
+        self.assertEqual(0, response['total'])
+
     def test_new_get(self):
         self.request.matched_route = Mock(name='c2cgeoform_item')
         self.request.route_url = Mock(return_value='person/new/edit')
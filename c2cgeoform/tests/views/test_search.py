@@ -0,0 +1,126 @@
+from functools import partial
+from unittest import TestCase
+from unittest.mock import Mock
+
+from c2cgeoform.models import DBSession
+from c2cgeoform.tests import DatabaseTestCase
+from c2cgeoform.tests.models_test import Person, Tag
+from c2cgeoform.views.abstract_views import AbstractViews, ListField
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from c2cgeoform.views.search import (
+    FullTextSearch,
+    ILikeSearch,
+    TrigramSearch,
+    relation_search_index_ddl,
+    relation_search_query,
+    search_indexes_ddl,
+)
+
+
+_list_field = partial(ListField, Person)
+
+
+class TrigramViews(AbstractViews):
+
+    _model = Person
+    _id_field = 'id'
+    _list_fields = [
+        _list_field('name'),
+        _list_field('first_name'),
+        _list_field('age')]
+    _search_backend = TrigramSearch()
+
+
+class TestSearchIndexesDDL(TestCase):
+
+    def test_trigram_index(self):
+        self.assertEqual([
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            'CREATE INDEX IF NOT EXISTS ix_tests_persons_search_trgm ON tests_persons USING gin '
+            "((lower(coalesce(name, '') || ' ' || coalesce(first_name, ''))) gin_trgm_ops)",
+        ], search_indexes_ddl([TrigramViews]))
+
+    def test_full_text_index(self):
+        class FullTextViews(TrigramViews):
+            _search_backend = FullTextSearch('french')
+
+        self.assertEqual([
+            'CREATE INDEX IF NOT EXISTS ix_tests_persons_search_fts ON tests_persons USING gin '
+            "((to_tsvector('french', coalesce(name, '') || ' ' || coalesce(first_name, ''))))",
+        ], search_indexes_ddl([FullTextViews]))
+
+    def test_no_index_for_ilike(self):
+        class ILikeViews(TrigramViews):
+            _search_backend = ILikeSearch()
+
+        self.assertEqual([], search_indexes_ddl([ILikeViews]))
+
+    def test_no_index_without_own_columns(self):
+        class TagViews(AbstractViews):
+            _model = Tag
+            _list_fields = [ListField(Person, 'name')]
+            _search_backend = TrigramSearch()
+
+        self.assertEqual([], search_indexes_ddl([TagViews]))
+
+
+class TestRelationSearch(TestCase):
+
+    def _compile(self, query):
+        return query.statement.compile(dialect=postgresql.dialect())
+
+    def test_prefix(self):
+        compiled = self._compile(relation_search_query(Session(), Person, 'id', 'name', ' Jo_ '))
+        sql = str(compiled)
+        self.assertIn('SELECT tests_persons.id, tests_persons.name', sql)
+        self.assertIn('WHERE lower(tests_persons.name) LIKE %(lower_1)s ESCAPE', sql)
+        self.assertIn('ORDER BY tests_persons.name, tests_persons.id', sql)
+        self.assertEqual('jo\\_%', compiled.params['lower_1'])
+
+    def test_trigram(self):
+        compiled = self._compile(relation_search_query(
+            Session(), Person, 'id', 'name', 'jo', mode='trigram', order_by='first_name'))
+        sql = str(compiled)
+        self.assertIn('WHERE lower(tests_persons.name) LIKE %(lower_1)s ESCAPE', sql)
+        self.assertIn('ORDER BY similarity(lower(tests_persons.name), %(similarity_1)s) DESC, '
+                      'tests_persons.first_name, tests_persons.id', sql)
+        self.assertEqual('%jo%', compiled.params['lower_1'])
+
+    def test_empty_term(self):
+        sql = str(self._compile(relation_search_query(Session(), Person, 'id', 'name', '')))
+        self.assertNotIn('WHERE', sql)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            relation_search_query(Session(), Person, 'id', 'name', 'jo', mode='other')
+
+    def test_index_ddl(self):
+        self.assertEqual([
+            'CREATE INDEX IF NOT EXISTS ix_tests_persons_name_prefix ON tests_persons USING btree '
+            '((lower(name)) text_pattern_ops)',
+        ], relation_search_index_ddl(Person, 'name'))
+        self.assertEqual([
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            'CREATE INDEX IF NOT EXISTS ix_tests_persons_name_trgm ON tests_persons USING gin '
+            '((lower(name)) gin_trgm_ops)',
+        ], relation_search_index_ddl(Person, 'name', 'trigram'))
+
+
+class TestTrigramSearch(DatabaseTestCase):
+
+    def test_grid_search(self):
+        self.request.route_url = Mock(return_value='person/1')
+        DBSession.add(Person(name='Smith', first_name='Peter'))
+        DBSession.add(Person(name='Wayne', first_name='John'))
+        DBSession.flush()
+
+        self.request.params['search'] = 'TER SMI'
+        response = TrigramViews(self.request).grid()
+        self.assertEqual(0, response['total'])
+
+        self.request.params['search'] = 'SMI TER'
+        response = TrigramViews(self.request).grid()
+        self.assertEqual(1, response['total'])
+        self.assertEqual('Smith', response['rows'][0]['name'])
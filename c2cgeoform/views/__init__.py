@@ -66,3 +66,9 @@ class TableViewPredicate(object):
 def includeme(config):
     config.add_view_predicate('application', ApplicationViewPredicate)
     config.add_view_predicate('table', TableViewPredicate)
+    # the options of the remote relation widgets are readable by the users
+    # having this permission, see c2cgeoform.views.relations
+    config.add_view('c2cgeoform.views.relations.relation',
+                    route_name='c2cgeoform_relation',
+                    renderer='json',
+                    permission=config.get_settings().get('c2cgeoform.relation_permission'))
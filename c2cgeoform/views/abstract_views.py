@@ -1,18 +1,41 @@
+import base64
+import csv
+import hashlib
+import io
+import json
 import logging
+import math
+import numbers
+import tempfile
+import time
+from operator import attrgetter
+from colander import Mapping, Sequence, null
 from deform import Form, ValidationFailure  # , ZPTRendererFactory
 from deform.form import Button
+from geoalchemy2 import Geometry
 from geoalchemy2.elements import WKBElement
-from geoalchemy2.shape import to_shape
+from pyramid.httpexceptions import HTTPBadRequest
 from pyramid.httpexceptions import HTTPNotFound
 from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import HTTPNotModified
 from pyramid.response import Response
-from sqlalchemy import desc, or_, types
+from pyramid.traversal import PATH_SEGMENT_SAFE, quote_path_segment
+from sqlalchemy import and_, cast, desc, false, func, literal_column, or_, tuple_, types
 from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.properties import ColumnProperty, RelationshipProperty
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from translationstring import TranslationString
-from geojson import FeatureCollection, Feature
 from c2cgeoform import _, default_map_settings
+from c2cgeoform.cache import LRUCache, boot_token, related_version
+from c2cgeoform.views.search import ILikeSearch
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +55,27 @@ After you fix the problem, please restart the Pyramid application to
 try it again.
 """
 
+# grid totals by query, see ``AbstractViews._grid_total``
+_totals_cache = LRUCache(maxsize=1024)
+
+# translated action labels by locale, see ``ItemAction.to_dict``
+_labels_cache = LRUCache(maxsize=4096)
+
+# content types by export format, see ``AbstractViews.export``
+_export_content_types = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# column types supported by ST_AsMVT, other values are cast to text
+_mvt_types = (types.Boolean, types.Float, types.Integer, types.Numeric, types.String)
+
+# half the width of the Web Mercator world, in meters
+_WEB_MERCATOR_HALF_WIDTH = 20037508.342789244
+
+# placeholder for the id in item URL templates, see ``AbstractViews._item_url``
+_ID_PLACEHOLDER = '__c2cgeoform_id__'
+
 
 def model_attr_info(attr, *keys, default=None):
     if attr is None:
@@ -44,6 +88,43 @@ def model_attr_info(attr, *keys, default=None):
     return value
 
 
+class Explain(Executable, ClauseElement):
+    """
+    ``EXPLAIN (FORMAT JSON)`` of a statement, executed with the statement
+    parameters, see ``AbstractViews._estimate_count``.
+    """
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) {}'.format(compiler.process(element.statement, **kw))
+
+
+def tile_bounds(z, x, y):
+    """
+    Return the bounds ``(minx, miny, maxx, maxy)`` of the tile ``z/x/y`` of
+    the Web Mercator tiling scheme, in EPSG:3857.
+    """
+    size = 2 * _WEB_MERCATOR_HALF_WIDTH / 2 ** z
+    minx = -_WEB_MERCATOR_HALF_WIDTH + x * size
+    maxy = _WEB_MERCATOR_HALF_WIDTH - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def parse_bbox(bbox):
+    """
+    Return the ``(minx, miny, maxx, maxy)`` floats of a ``bbox`` parameter.
+    """
+    try:
+        minx, miny, maxx, maxy = (float(value) for value in bbox.split(','))
+    except ValueError:
+        raise HTTPBadRequest('Invalid bbox: {}'.format(bbox))
+    return minx, miny, maxx, maxy
+
+
 class ListField():
     def __init__(self,
                  model=None,
@@ -53,7 +134,9 @@ class ListField():
                  renderer=None,
                  sort_column=None,
                  filter_column=None,
-                 visible=True):
+                 visible=True,
+                 columns=None,
+                 relationships=None):
         self._attr = getattr(model, attr) if model else attr
         self._key = key or self._attr.key
         self._label = (label or
@@ -63,6 +146,13 @@ class ListField():
                        self._key)
         self._renderer = renderer or self._prop_renderer
         is_column = isinstance(self._attr.property, ColumnProperty)
+        self._column = self._attr if is_column and renderer is None else None
+        self._columns = columns if columns is not None \
+            else [self._column] if self._column is not None \
+            else None
+        self._relationships = relationships if relationships is not None \
+            else [self._attr] if isinstance(self._attr.property, RelationshipProperty) \
+            else []
         self._sort_column = sort_column or (self._attr if is_column else None)
         self._filter_column = filter_column if filter_column is not None \
             else self._attr if is_column \
@@ -72,7 +162,10 @@ class ListField():
     def _prop_renderer(self, entity):
         value = None
         if self._attr is not None:
-            value = getattr(entity, self._attr.key)
+            # rows projected by AbstractViews._grid_columns hold the value
+            # of the field column under the field id
+            projected = isinstance(entity, tuple) and self._column is not None
+            value = getattr(entity, self._key if projected else self._attr.key)
         if value is None:
             value = ''
         else:
@@ -101,9 +194,34 @@ class ListField():
     def sort_column(self):
         return self._sort_column
 
+    def filter_column(self):
+        return self._filter_column
+
     def filter_expression(self, term):
         return self._filter_column.ilike(term)
 
+    def column(self):
+        """
+        Return the column holding the value of this field, or ``None`` if it
+        has a custom renderer or is not backed by a column.
+        """
+        return self._column
+
+    def columns(self):
+        """
+        Return the columns needed to render this field, or ``None`` if the
+        renderer needs the full entity.
+        """
+        return self._columns
+
+    def relationships(self):
+        """
+        Return the relationships used by the renderer, each one being a
+        relationship attribute or a sequence of them for nested
+        relationships.
+        """
+        return self._relationships
+
     def visible(self):
         return self._visible
 
@@ -153,12 +271,46 @@ class ItemAction():
             'name': self._name,
             'url': self._url,
             'method': self._method,
-            'label': request.localizer.translate(self._label),
+            'label': self._translated_label(request),
             'css_class': self._css_class,
             'icon': self._icon,
             'confirmation': self._confirmation
         }
 
+    def _translated_label(self, request):
+        label = self._label
+        if not isinstance(label, TranslationString) or label.mapping:
+            return request.localizer.translate(label)
+        key = (request.locale_name, label.domain, str(label), label.default)
+        translated = _labels_cache.get(key)
+        if translated is None:
+            translated = _labels_cache[key] = request.localizer.translate(label)
+        return translated
+
+
+class RowBuilder():
+    """
+    Accessors of the list fields of a views class, compiled once per class,
+    used to build the grid rows and the GeoJSON features properties.
+    """
+
+    def __init__(self, list_fields, id_field):
+        self.list_fields = list_fields
+        self._accessors = tuple((field.id(), field.value) for field in list_fields)
+        self.id = attrgetter(id_field)
+
+    def properties(self, entity):
+        return {key: value(entity) for key, value in self._accessors}
+
+    def values(self, entity):
+        return [value(entity) for dummy, value in self._accessors]
+
+    def row(self, entity):
+        row = self.properties(entity)
+        id_ = self.id(entity)
+        row['_id_'] = '' if id_ is None else str(id_)
+        return row
+
 
 class UserMessage:
     def __init__(self, text, css_class="alert-success"):
@@ -184,6 +336,28 @@ class AbstractViews():
     _id_field = None  # Primary key
     _geometry_field = None  # Geometry field
     _base_schema = None  # base colander schema
+    _pagination = 'offset'  # grid pagination mode, 'offset' or 'keyset'
+    _total_count = 'exact'  # grid total strategy, 'exact', 'cached' or 'estimated'
+    _total_estimate_threshold = 100000  # estimated totals below this are counted
+    _total_cache_ttl = 60  # seconds the 'cached' totals are kept
+    _search_backend = ILikeSearch()  # grid search backend, see c2cgeoform.views.search
+    _grid_column_projection = False  # load only the list fields columns when possible
+    _export_batch_size = 1000  # rows fetched at once by export
+    _conditional_get = False  # answer If-None-Match of data views, see _not_modified
+    _geojson_max_decimal_digits = 9  # digits of the geojson coordinates
+    _geojson_srid_decimal_digits = {}  # digits of the geojson coordinates by srid
+    _geojson_simplify_pixels = 1  # geojson simplification tolerance, in pixels
+    _stream_geojson = False  # write the geojson features as they are fetched
+    _geojson_batch_size = 1000  # rows fetched at once by streamed geojson
+    _flatgeobuf = False  # serve geojson as FlatGeobuf on request, see geojson
+    _geojson_cache = None  # c2cgeoform.cache.ResponseCache for geojson responses
+    _geojson_fields = None  # list fields ids of the geojson properties, default to all
+    _feature_info_max_ids = 100  # maximum number of features of feature_info
+    _cluster_max_zoom = None  # cluster the geojson features up to this zoom level
+    _cluster_pixels = 60  # size of the clusters grid cells, in pixels
+    _tile_properties = None  # list fields ids carried by vector tiles, see _tile_columns
+    _tile_extent = 4096  # vector tiles extent, in tile coordinates
+    _tile_buffer = 64  # vector tiles clipping buffer, in tile coordinates
 
     MSG_COL = {
         'submit_ok': UserMessage(_('Your submission has been taken into account.'), "alert-success"),
@@ -195,6 +369,7 @@ class AbstractViews():
         self._schema = None
         self._appstruct = None
         self._obj = None
+        self._url_templates = {}
 
     def index(self):
         return {
@@ -205,7 +380,16 @@ class AbstractViews():
     def grid(self):
         """
         API method which serves the JSON data for the Bootgrid table in the admin view.
+
+        In ``keyset`` pagination mode, the response also contains a ``cursor``
+        which can be passed back to get the next page without using OFFSET.
+
+        ``total_approximate`` tells if ``total`` is a planner estimate, see
+        ``_grid_total``.
         """
+        not_modified = self._not_modified()
+        if not_modified is not None:
+            return not_modified
         try:
             params = self._request.params
             offset = int(params.get('offset', 0) if params.get('offset') != 'NaN' else 0)
@@ -214,18 +398,126 @@ class AbstractViews():
             sort = params.get('sort', '')
             order = params.get('order', '')
 
-            query = self._base_query()
-            query = self._filter_query(query, search)
-            query = self._sort_query(query, sort, order)
+            query = self._grid_query(search, sort, order)
+
+            total, approximate = self._grid_total(query)
+
+            if self._pagination == 'keyset':
+                rows, cursor = self._keyset_grid_rows(
+                    query, search, sort, order, params.get('cursor'), offset, limit)
+                return {
+                    "rows": rows,
+                    "total": total,
+                    "total_approximate": approximate,
+                    "cursor": cursor
+                }
 
             return {
                 "rows": self._grid_rows(query, offset, limit),
-                "total": query.count()
+                "total": total,
+                "total_approximate": approximate
             }
         except DBAPIError as e:
             logger.error(str(e), exc_info=True)
             return Response(db_err_msg, content_type='text/plain', status=500)
 
+    def export(self):
+        """
+        API method which streams the grid rows as a CSV or XLSX file, according
+        to the ``format`` route segment, using the same ``search``, ``sort``
+        and ``order`` parameters as ``grid``.
+
+        Rows are fetched from a server-side cursor by batches of
+        ``_export_batch_size`` and written as they come, so that the memory
+        used does not depend on the number of rows. The XLSX format requires
+        ``xlsxwriter``.
+        """
+        format_ = self._request.matchdict.get('format', 'csv')
+        if format_ not in _export_content_types or (format_ == 'xlsx' and xlsxwriter is None):
+            raise HTTPNotFound()
+
+        params = self._request.params
+        query = self._grid_query(
+            params.get('search', '').strip(),
+            params.get('sort', ''),
+            params.get('order', ''))
+        header = [self._request.localizer.translate(field.label()) for field in self._list_fields]
+        rows = self._export_rows(query)
+
+        response = Response(
+            app_iter=self._csv_iter(header, rows) if format_ == 'csv' else self._xlsx_iter(header, rows),
+            content_type=_export_content_types[format_])
+        response.content_disposition = 'attachment; filename="{}.{}"'.format(
+            self._request.matchdict.get('table') or self._model.__tablename__, format_)
+        return response
+
+    def _export_rows(self, query):
+        """
+        Yield the values of the list fields for the rows of ``query``.
+        """
+        for pkey_column in inspect(self._model).primary_key:
+            query = query.order_by(pkey_column)
+        columns = self._grid_columns()
+        if columns is not None:
+            query = query.with_entities(*columns).enable_eagerloads(False)
+        else:
+            query = self._eager_load_query(query)
+
+        builder = self._row_builder()
+        for entity in self._stream_query(query, self._export_batch_size):
+            yield builder.values(entity)
+
+    def _stream_query(self, query, batch_size):
+        """
+        Yield the rows of ``query``, fetched from a server-side cursor by
+        batches of ``batch_size`` rows.
+
+        Streamed response bodies are generated after the request transaction
+        is closed, so the rows are fetched using a dedicated session, of the
+        class and with the configuration of the query session, bound like it
+        to the connectable of the views model.
+        """
+        dbsession = query.session
+        session = type(dbsession)(
+            bind=dbsession.get_bind(mapper=inspect(self._model)),
+            autoflush=dbsession.autoflush,
+            expire_on_commit=dbsession.expire_on_commit,
+            info=dict(dbsession.info))
+        try:
+            yield from query.with_session(session).yield_per(batch_size)
+        finally:
+            session.close()
+
+    def _csv_iter(self, header, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+        for index, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if index % self._export_batch_size == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode('utf-8')
+
+    def _xlsx_iter(self, header, rows):
+        # an XLSX file is a zip archive which can only be sent once complete,
+        # the worksheet is written in a temporary file in constant memory mode
+        with tempfile.TemporaryFile() as output:
+            workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+            worksheet = workbook.add_worksheet()
+            worksheet.write_row(0, 0, header)
+            for index, row in enumerate(rows, 1):
+                for col, value in enumerate(row):
+                    # the values are rendered by the list fields, as in the CSV
+                    if value is None or isinstance(value, (str, numbers.Number)):
+                        worksheet.write(index, col, value)
+                    else:
+                        worksheet.write_string(index, col, str(value))
+            workbook.close()
+            output.seek(0)
+            yield from iter(lambda: output.read(65536), b'')
+
     def map(self, map_settings={}):
         map_options = {
             **default_map_settings,
@@ -239,6 +531,10 @@ class AbstractViews():
             },
             **map_settings
         }
+        if self._geojson_fields is not None:
+            map_options['featureInfoUrl'] = self._request.route_url('c2cgeoform_feature_info')
+        if map_options['vectorTiles']:
+            map_options['tilesUrl'] = self._tiles_url()
         return {
             "map_options": {
                 key: (
@@ -251,46 +547,477 @@ class AbstractViews():
         }
 
     def geojson(self):
+        """
+        API method which serves the features of the model for the map view.
+
+        The features can be restricted to a bounding box with the ``bbox``
+        parameter (``minx,miny,maxx,maxy`` in ``srid``), so that the map only
+        loads the visible features, and the geometries simplified for the map
+        resolution with the ``resolution`` or ``zoom`` parameter.
+
+        Below ``_cluster_max_zoom``, the features are aggregated in clusters,
+        see ``_cluster_query``.
+
+        With ``_flatgeobuf``, the features are returned as FlatGeobuf to the
+        clients which prefer ``application/flatgeobuf``.
+
+        With ``_stream_geojson``, the FeatureCollection is written as the rows
+        are fetched, so the memory used does not depend on the number of
+        features.
+
+        With a ``_geojson_cache``, the responses which are not streamed are
+        cached, keyed by their ETag (see ``_etag``), so they get stale when
+        rows of the model or of its relationships change.
+        """
+        not_modified = self._not_modified()
+        if not_modified is not None:
+            return not_modified
+
+        if self._flatgeobuf:
+            self._request.response.vary = ('Accept',)
+
+        if self._geojson_cache is None:
+            return self._geojson_response()
+
+        key = self._etag()
+        cached = self._geojson_cache.get(key)
+        response = self._request.response
+        if cached is not None:
+            response.content_type, response.body = cached
+            return response
+        response = self._geojson_response()
+        if not self._stream_geojson or response.content_type == 'application/flatgeobuf':
+            self._geojson_cache[key] = (response.content_type, response.body)
+        return response
+
+    def _geojson_response(self):
         srid = int(self._request.params.get("srid", 3857))
 
-        query = self._base_query().add_column(
-            getattr(self._model, self._geometry_field).
-            ST_Transform(srid).
-            label('_geometry')
-        )
+        cluster_size = self._cluster_size(self._geojson_resolution(srid))
+        if self._flatgeobuf and cluster_size is None and self._accepts_flatgeobuf():
+            return self._flatgeobuf_response(srid)
 
-        features = list()
-        for entity, geometry in query:
-            features.append(Feature(
-                id=getattr(entity, self._id_field),
-                geometry=to_shape(geometry) if geometry is not None else None,
-                properties={
-                    f.id(): f.value(entity)
-                    for f in self._list_fields
-                }
-            ))
-        return FeatureCollection(features)
+        if cluster_size is None:
+            query, to_features = self._geojson_query(srid), self._geojson_features
+        else:
+            query, to_features = self._cluster_query(srid, cluster_size), self._cluster_features
+
+        response = self._request.response
+        response.content_type = 'application/json'
+        if self._stream_geojson:
+            response.app_iter = self._geojson_iter(
+                to_features(self._stream_query(query, self._geojson_batch_size)))
+        else:
+            response.text = '{{"type": "FeatureCollection", "features": [{}]}}'.format(
+                ', '.join(to_features(query)))
+        return response
+
+    def _geojson_iter(self, features):
+        yield b'{"type": "FeatureCollection", "features": ['
+        batch = []
+        separator = ''
+        for index, feature in enumerate(features, 1):
+            batch.append(separator + feature)
+            separator = ', '
+            if index % self._geojson_batch_size == 0:
+                yield ''.join(batch).encode('utf-8')
+                batch = []
+        batch.append(']}')
+        yield ''.join(batch).encode('utf-8')
+
+    def _accepts_flatgeobuf(self):
+        offers = self._request.accept.acceptable_offers(['application/json', 'application/flatgeobuf'])
+        return len(offers) > 0 and offers[0][0] == 'application/flatgeobuf'
+
+    def _flatgeobuf_response(self, srid):
+        response = self._request.response
+        response.content_type = 'application/flatgeobuf'
+        response.body = bytes(self._flatgeobuf_query(srid).scalar() or b'')
+        return response
+
+    def _flatgeobuf_query(self, srid):
+        """
+        Return the query of the features serialized by PostGIS as FlatGeobuf,
+        with a spatial index, using ``ST_AsFlatGeobuf`` (PostGIS 3.2+).
+
+        The features carry their id in the ``_id_`` property and the values of
+        the list fields backed by a column, restricted to ``_geojson_fields``
+        as for GeoJSON.
+        """
+        query = self._base_query(). \
+            filter(getattr(self._model, self._geometry_field).isnot(None))
+        bbox = self._request.params.get('bbox')
+        if bbox is not None:
+            query = self._bbox_query(query, bbox, srid)
+        features = query.with_entities(
+            getattr(self._model, self._id_field).label('_id_'),
+            *self._property_columns(self._geojson_fields),
+            self._geojson_geometry(srid, self._geojson_resolution(srid)).label('_geometry_')
+        ).subquery('features')
+        return self._request.dbsession.query(
+            func.ST_AsFlatGeobuf(literal_column('features'), True, '_geometry_')
+        ).select_from(features)
+
+    def _geojson_query(self, srid):
+        """
+        Return the query of the features, each row holding the values needed
+        by the list fields renderers and the geometry serialized by PostGIS.
+        """
+        query = self._base_query()
+        bbox = self._request.params.get('bbox')
+        if bbox is not None:
+            query = self._bbox_query(query, bbox, srid)
+        resolution = self._geojson_resolution(srid)
+        geometry = func.ST_AsGeoJSON(
+            self._geojson_geometry(srid, resolution),
+            self._geojson_decimal_digits(srid, resolution)).label('_geometry')
+
+        list_fields = self._geojson_list_fields()
+        columns = self._grid_columns(list_fields)
+        if columns is not None:
+            return query.with_entities(*columns, geometry).enable_eagerloads(False)
+        return self._eager_load_query(query, list_fields).add_column(geometry)
+
+    def _geojson_list_fields(self):
+        """
+        Return the list fields which values are the properties of the GeoJSON
+        features, those listed in ``_geojson_fields`` or by default all of
+        them.
+        """
+        if self._geojson_fields is None:
+            return self._list_fields
+        return [field for field in self._list_fields if field.id() in self._geojson_fields]
+
+    def _cluster_size(self, resolution):
+        """
+        Return the size of the clusters grid cells, ``_cluster_pixels`` pixels
+        at the map ``resolution``, or ``None`` if the features are not
+        clustered at this resolution.
+
+        The zoom level is the one of the Web Mercator tiling scheme for this
+        resolution, so ``_cluster_max_zoom`` is meant for projections in
+        meters.
+        """
+        if self._cluster_max_zoom is None or resolution is None:
+            return None
+        zoom = math.log2(2 * _WEB_MERCATOR_HALF_WIDTH / 256 / resolution)
+        if round(zoom, 6) > self._cluster_max_zoom:
+            return None
+        return resolution * self._cluster_pixels
+
+    def _cluster_query(self, srid, size):
+        """
+        Return the query of the clusters: the features are grouped by the
+        cells of a grid of ``size`` (``ST_SnapToGrid`` on their centroids)
+        and each row holds the cell, the number of features and their centroid
+        serialized by PostGIS.
+
+        With the ``bbox`` parameter, only the cells which center is in the bbox
+        extended by half a cell are returned, each one with all its features,
+        so that clusters are the same whatever the bbox.
+        """
+        id_column = getattr(self._model, self._id_field)
+        ids = self._base_query().with_entities(id_column)
+        bbox = self._request.params.get('bbox')
+        if bbox is not None:
+            minx, miny, maxx, maxy = parse_bbox(bbox)
+            ids = ids.filter(self._envelope_filter(
+                func.ST_MakeEnvelope(minx - size, miny - size, maxx + size, maxy + size, srid), srid))
+
+        point = func.ST_Centroid(func.ST_Transform(getattr(self._model, self._geometry_field), srid))
+        cell = func.ST_SnapToGrid(point, size)
+        query = self._request.dbsession.query(
+            func.ST_AsText(cell).label('_cell'),
+            func.count().label('_count'),
+            func.ST_AsGeoJSON(
+                func.ST_Centroid(func.ST_Collect(point)),
+                self._geojson_decimal_digits(srid, size / self._cluster_pixels)).label('_geometry')
+        ). \
+            filter(id_column.in_(ids.subquery())). \
+            filter(getattr(self._model, self._geometry_field).isnot(None)). \
+            group_by(cell)
+        if bbox is not None:
+            half = size / 2
+            query = query.having(cell.intersects(func.ST_MakeEnvelope(
+                minx - half, miny - half, maxx + half, maxy + half, srid)))
+        return query
+
+    def _cluster_features(self, rows):
+        for cell, count, geometry in rows:
+            yield '{{"type": "Feature", "id": {}, "geometry": {}, "properties": {}}}'.format(
+                json.dumps('cluster:' + cell),
+                geometry,
+                json.dumps({'cluster': True, 'count': count}))
+
+    def _geojson_resolution(self, srid):
+        """
+        Return the map resolution, in ``srid`` units per pixel, given by the
+        ``resolution`` parameter or by the ``zoom`` parameter with the Web
+        Mercator tiling scheme, or ``None``.
+        """
+        params = self._request.params
+        try:
+            if 'resolution' in params:
+                resolution = float(params['resolution'])
+            elif 'zoom' in params:
+                if srid != 3857:
+                    raise HTTPBadRequest('zoom is only supported with srid 3857, use resolution')
+                resolution = 2 * _WEB_MERCATOR_HALF_WIDTH / 256 / 2 ** float(params['zoom'])
+            else:
+                return None
+        except (ValueError, OverflowError):
+            raise HTTPBadRequest('Invalid resolution or zoom')
+        if not resolution > 0:
+            raise HTTPBadRequest('Invalid resolution or zoom')
+        return resolution
+
+    def _geojson_geometry(self, srid, resolution=None):
+        """
+        Return the geometry expression of the features, transformed to
+        ``srid`` and, for a given map ``resolution``, simplified with a
+        tolerance of ``_geojson_simplify_pixels`` pixels.
+        """
+        geometry = func.ST_Transform(getattr(self._model, self._geometry_field), srid)
+        if resolution is not None:
+            geometry = func.ST_SimplifyPreserveTopology(
+                geometry, resolution * self._geojson_simplify_pixels)
+        return geometry
+
+    def _geojson_decimal_digits(self, srid, resolution=None):
+        """
+        Return the number of decimal digits of the coordinates, given by
+        ``_geojson_srid_decimal_digits`` or ``_geojson_max_decimal_digits``,
+        and for a given map ``resolution`` one more than needed for a pixel.
+        """
+        digits = self._geojson_srid_decimal_digits.get(srid, self._geojson_max_decimal_digits)
+        if resolution is not None:
+            digits = min(digits, max(0, math.ceil(-math.log10(resolution)) + 1))
+        return digits
+
+    def _geojson_features(self, rows):
+        """
+        Yield the GeoJSON features of ``rows`` as JSON strings, the geometries
+        already serialized by PostGIS being spliced in as they are.
+        """
+        list_fields = self._geojson_list_fields()
+        builder = self._row_builder() if list_fields is self._list_fields \
+            else RowBuilder(list_fields, self._id_field)
+        projected = self._grid_columns(list_fields) is not None
+        for row in rows:
+            values = row if projected else row[0]
+            yield '{{"type": "Feature", "id": {}, "geometry": {}, "properties": {}}}'.format(
+                json.dumps(builder.id(values), default=str),
+                row[-1] or 'null',
+                json.dumps(builder.properties(values), default=str))
+
+    def feature_info(self):
+        """
+        API method which returns the values of all the list fields for the
+        features which ids are given by the ``id`` parameters (repeated or
+        comma separated, at most ``_feature_info_max_ids``), to complete the
+        lightweight GeoJSON features, see ``_geojson_fields``.
+        """
+        ids = [
+            id_
+            for value in self._request.params.getall('id')
+            for id_ in value.split(',')
+            if id_ != ''
+        ]
+        if len(ids) > self._feature_info_max_ids:
+            raise HTTPBadRequest('Too many ids, the maximum is {}'.format(self._feature_info_max_ids))
+        if len(ids) == 0:
+            return {'features': []}
+
+        id_column = getattr(self._model, self._id_field)
+        try:
+            python_type = id_column.type.python_type
+        except NotImplementedError:
+            python_type = str
+        try:
+            ids = [python_type(id_) for id_ in ids]
+        except (TypeError, ValueError):
+            raise HTTPBadRequest('Invalid ids: {}'.format(','.join(ids)))
+
+        query = self._base_query().filter(id_column.in_(ids))
+        columns = self._grid_columns()
+        if columns is not None:
+            query = query.with_entities(*columns).enable_eagerloads(False)
+        else:
+            query = self._eager_load_query(query)
+
+        builder = self._row_builder()
+        return {
+            'features': [
+                {'id': builder.id(row), 'properties': builder.properties(row)}
+                for row in query
+            ]
+        }
+
+    def mvt(self):
+        """
+        API method which serves the features of the model as Mapbox Vector
+        Tiles, in the Web Mercator tiling scheme, using ``ST_AsMVT``.
+
+        The features carry their id in the ``_id_`` property and the values of
+        the list fields listed in ``_tile_properties``.
+        """
+        try:
+            z, x, y = (int(self._request.matchdict[key]) for key in ('z', 'x', 'y'))
+        except ValueError:
+            raise HTTPNotFound()
+        if not (0 <= z <= 30 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise HTTPNotFound()
+
+        not_modified = self._not_modified()
+        if not_modified is not None:
+            return not_modified
+
+        tile = self._tile_query(z, x, y).scalar()
+
+        response = self._request.response
+        response.content_type = 'application/vnd.mapbox-vector-tile'
+        response.body = bytes(tile or b'')
+        return response
+
+    def _tile_query(self, z, x, y):
+        bounds = tile_bounds(z, x, y)
+        envelope = func.ST_MakeEnvelope(*bounds, 3857)
+        # also select the features of the clipping buffer
+        buffer = (bounds[2] - bounds[0]) * self._tile_buffer / self._tile_extent
+        geometry = getattr(self._model, self._geometry_field)
+        features = self._base_query(). \
+            filter(self._envelope_filter(func.ST_Expand(envelope, buffer), 3857)). \
+            with_entities(
+                getattr(self._model, self._id_field).label('_id_'),
+                *self._tile_columns(),
+                func.ST_AsMVTGeom(
+                    func.ST_Transform(geometry, 3857),
+                    envelope,
+                    self._tile_extent,
+                    self._tile_buffer,
+                    True).label('_geometry_')). \
+            subquery('tile')
+        return self._request.dbsession.query(
+            func.ST_AsMVT(literal_column('tile'), self._model.__tablename__,
+                          self._tile_extent, '_geometry_')
+        ).select_from(features)
+
+    def _tile_columns(self):
+        """
+        Return the labeled columns of the list fields carried by the vector
+        tiles, those listed in ``_tile_properties`` or by default all the list
+        fields backed by a non geometry column.
+        """
+        return self._property_columns(self._tile_properties)
+
+    def _property_columns(self, field_ids=None):
+        """
+        Return the labeled columns of the list fields backed by a non geometry
+        column, restricted to ``field_ids`` if given, to serialize properties
+        in the database.
+        """
+        columns = []
+        for field in self._list_fields:
+            column = field.column()
+            if column is None or isinstance(column.type, Geometry):
+                continue
+            if field_ids is not None and field.id() not in field_ids:
+                continue
+            if not isinstance(column.type, _mvt_types):
+                column = cast(column, types.String)
+            columns.append(column.label(field.id()))
+        return columns
+
+    def _tiles_url(self):
+        """
+        Return the URL template of the vector tiles, with ``{z}``, ``{x}`` and
+        ``{y}`` placeholders.
+        """
+        return self._request.route_url('c2cgeoform_mvt', z='{z}', x='{x}', y='{y}'). \
+            replace('%7B', '{').replace('%7D', '}')
 
     def _base_query(self):
         return self._request.dbsession.query(self._model)
 
-    def _filter_query(self, query, search_phrase):
-        if search_phrase != '':
-            search_expr = '%' + '%'.join(search_phrase.split()) + '%'
+    def _bbox_query(self, query, bbox, srid):
+        """
+        Filter ``query`` on the rows which geometry bounding box intersects
+        ``bbox``, using the ``&&`` operator.
 
-            # create `ilike` filters for every list text field
-            filters = []
-            for field in self._list_fields:
-                if field.filtrable():
-                    filters.append(field.filter_expression(search_expr))
+        The envelope is transformed to the SRID of the geometry column rather
+        than the column to ``srid``, so that the spatial index can be used.
+        """
+        return query.filter(self._envelope_filter(
+            func.ST_MakeEnvelope(*parse_bbox(bbox), srid), srid))
 
-            # then join the filters into one `or` condition
-            if len(filters) > 0:
-                query = query.filter(or_(*filters))
+    def _envelope_filter(self, envelope, srid):
+        geometry = getattr(self._model, self._geometry_field)
+        geometry_srid = geometry.type.srid
+        if geometry_srid > 0 and geometry_srid != srid:
+            envelope = func.ST_Transform(envelope, geometry_srid)
+        return geometry.intersects(envelope)
 
+    def _etag(self):
+        """
+        Return the ETag of the response, derived from the version of the model
+        and of its relationships (see ``c2cgeoform.cache.related_version``),
+        the route, the request parameters and accepted types, the locale and
+        the user.
+        """
+        key = json.dumps([
+            boot_token,
+            self._request.matched_route.name,
+            self._request.matchdict,
+            self._model.__name__,
+            related_version(self._model),
+            sorted(self._request.params.items()),
+            self._request.headers.get('Accept'),
+            self._request.locale_name,
+            self._request.authenticated_userid,
+        ], default=str)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _not_modified(self):
+        """
+        When ``_conditional_get`` is enabled, set the ETag of the response and
+        return an ``HTTPNotModified`` response if the client already has the
+        current version, without running any query.
+
+        Versions are tracked per process: use it with a single process, or when
+        all the writes go through the process serving the reads.
+        """
+        if not self._conditional_get:
+            return None
+        etag = self._etag()
+        if etag in self._request.if_none_match:
+            return HTTPNotModified(etag=etag, cache_control='no-cache')
+        self._request.response.etag = etag
+        self._request.response.cache_control = 'no-cache'
+        return None
+
+    def _grid_query(self, search, sort, order):
+        query = self._base_query()
+        query = self._filter_query(query, search)
+        if search != '' and sort == '' and self._pagination != 'keyset':
+            query = self._rank_query(query, search)
+        return self._sort_query(query, sort, order)
+
+    def _filter_query(self, query, search_phrase):
+        if search_phrase != '':
+            query = self._search_backend.filter_query(
+                query, self._model, self._list_fields, search_phrase)
         return query
 
+    def _rank_query(self, query, search_phrase):
+        return self._search_backend.rank_query(
+            query, self._model, self._list_fields, search_phrase)
+
     def _sort_query(self, query, sort, order):
+        if self._pagination == 'keyset':
+            # keyset pagination needs all the key columns in the same direction
+            for column in self._keyset_columns(sort):
+                query = query.order_by(desc(column) if order == 'desc' else column)
+            return query
         for field in self._list_fields:
             if field.id() == sort:
                 if order == 'desc':
@@ -302,6 +1029,53 @@ class AbstractViews():
             query = query.order_by(order_field)
         return query
 
+    def _grid_total(self, query):
+        """
+        Return the number of rows of the grid query and whether it is an
+        approximation, according to ``_total_count``:
+
+        - ``exact``: count the rows on each request.
+        - ``cached``: count the rows and keep the result in an in-process
+          cache, keyed by the query SQL and parameters (so by table, search
+          term and filters) and the model version, which changes when rows
+          of the model are flushed, for at most ``_total_cache_ttl`` seconds
+          so that changes made by other processes are eventually seen.
+        - ``estimated``: use the planner row estimate when it is above
+          ``_total_estimate_threshold``, count the rows otherwise.
+        """
+        if self._total_count == 'cached':
+            # read the version before counting so that rows flushed meanwhile
+            # invalidate the cached value
+            key = (self._model, related_version(self._model)) + self._query_key(query)
+            cached = _totals_cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1], False
+            total = query.count()
+            _totals_cache[key] = (time.monotonic() + self._total_cache_ttl, total)
+            return total, False
+        if self._total_count == 'estimated':
+            estimate = self._estimate_count(query)
+            if estimate >= self._total_estimate_threshold:
+                return estimate, True
+        return query.count(), False
+
+    def _query_key(self, query):
+        dialect = self._request.dbsession.get_bind(mapper=inspect(self._model)).dialect
+        compiled = query.statement.compile(dialect=dialect)
+        return (str(compiled), repr(sorted(compiled.params.items())))
+
+    def _estimate_count(self, query):
+        """
+        Return the number of rows of ``query`` estimated by the PostgreSQL
+        planner, which relies on table statistics (``pg_class.reltuples``)
+        and costs about nothing compared to ``count()``.
+        """
+        plan = self._request.dbsession.execute(
+            Explain(query.statement), mapper=inspect(self._model)).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
     def _grid_rows(self, query, offset, limit):
         # Sort on primary key as subqueryload with limit need deterministic order
         for pkey_column in inspect(self._model).primary_key:
@@ -310,26 +1084,203 @@ class AbstractViews():
         if limit != -1:
             query = query.limit(limit) \
                 .offset(offset)
+
+        columns = self._grid_columns()
+        if columns is not None:
+            query = query.with_entities(*columns).enable_eagerloads(False)
+        else:
+            query = self._eager_load_query(query)
+        return [self._grid_row(entity) for entity in query]
+
+    def _eager_load_options(self, list_fields=None):
+        """
+        Return ``selectinload`` options for the relationships used by the list
+        fields renderers (or those of ``list_fields``), so that rendering a
+        page of entities issues a fixed number of queries.
+        """
+        options = {}
+        for field in self._list_fields if list_fields is None else list_fields:
+            for path in field.relationships():
+                if not isinstance(path, (list, tuple)):
+                    path = (path,)
+                key = tuple((attr.class_, attr.key) for attr in path)
+                if key not in options:
+                    option = selectinload(path[0])
+                    for attr in path[1:]:
+                        option = option.selectinload(attr)
+                    options[key] = option
+        return list(options.values())
+
+    def _eager_load_query(self, query, list_fields=None):
+        options = self._eager_load_options(list_fields)
+        return query.options(*options) if options else query
+
+    def _grid_columns(self, list_fields=None):
+        """
+        Return the labeled columns needed to render the grid rows (or the
+        ``list_fields`` values), or ``None`` if some list fields need full
+        entities.
+
+        When all list fields are column-backed (or declare the columns their
+        renderer needs), only those columns and the id are selected, and the
+        renderers and item actions receive lightweight rows instead of
+        entities: the column of a column-backed field is labeled with the
+        field id, the columns declared for a renderer and the id with their
+        key. Entities are also used when two of those labels clash.
+        """
+        if not self._grid_column_projection:
+            return None
+        labeled = [(self._id_field, getattr(self._model, self._id_field))]
+        for field in self._list_fields if list_fields is None else list_fields:
+            field_columns = field.columns()
+            if field_columns is None:
+                return None
+            column = field.column()
+            if column is not None:
+                labeled.append((field.id(), column))
+            labeled.extend((c.key, c) for c in field_columns if c is not column)
+        columns = {}
+        for key, column in labeled:
+            if columns.setdefault(key, column) is not column:
+                return None
+        return [column.label(key) for key, column in columns.items()]
+
+    def _row_builder(self):
+        """
+        Return the ``RowBuilder`` of this views class, compiled on first use.
+        """
+        cls = type(self)
+        builder = cls.__dict__.get('_compiled_row_builder')
+        if builder is None or builder.list_fields is not self._list_fields:
+            builder = RowBuilder(self._list_fields, self._id_field)
+            if self._list_fields is cls._list_fields:
+                cls._compiled_row_builder = builder
+        return builder
+
+    def _grid_row(self, entity):
+        row = self._row_builder().row(entity)
+        row['actions'] = self._grid_item_actions(entity)
+        return row
+
+    def _keyset_columns(self, sort):
+        """
+        Return the columns used as pagination key: the sort column, or the
+        default order by columns when no sort is requested, followed by the
+        primary key to get a total order.
+        """
+        columns = [
+            field.sort_column() for field in self._list_fields
+            if field.id() == sort and field.sortable()
+        ] or list(self._list_ordered_fields)
+        return columns + list(inspect(self._model).primary_key)
+
+    def _keyset_grid_rows(self, query, search, sort, order, cursor, offset, limit):
+        """
+        Return the grid rows following the position given by ``cursor`` and
+        the cursor of the next page (``None`` on last page).
+
+        Without a valid cursor (first page or jump to a random page) this
+        falls back to ``offset``.
+        """
+        columns = self._keyset_columns(sort)
+        values = self._decode_cursor(cursor, search, sort, order, len(columns))
+        if values is not None:
+            query = query.filter(self._keyset_filter(columns, values, order == 'desc'))
+        elif offset:
+            query = query.offset(offset)
+        if limit != -1:
+            query = query.limit(limit)
+
+        grid_columns = self._grid_columns()
+        if grid_columns is not None:
+            query = query.with_entities(*grid_columns).enable_eagerloads(False)
+        else:
+            query = self._eager_load_query(query)
+        # fetch the key values along with the rows to build the next cursor
+        query = query.add_columns(*[
+            column.label('_keyset_{}'.format(i)) for i, column in enumerate(columns)
+        ])
         rows = []
+        key = None
+        for result in query:
+            key = list(result[-len(columns):])
+            rows.append(self._grid_row(result if grid_columns is not None else result[0]))
 
-        for entity in query:
-            row = {
-                f.id(): f.value(entity) for f in (
-                    self._list_fields + [ListField(self._model, self._id_field, key='_id_')]
-                )
-            }
-            row['actions'] = self._grid_item_actions(entity)
-            rows.append(row)
-        return rows
+        next_cursor = None
+        if limit != -1 and len(rows) == limit:
+            next_cursor = self._encode_cursor(search, sort, order, key)
+        return rows, next_cursor
+
+    def _keyset_filter(self, columns, values, descending):
+        """
+        Return a condition selecting the rows after ``values`` in the order
+        given by ``columns``.
+
+        A row-value comparison is used when no NULL value is involved, so
+        that an index on the key columns can be used for the seek.
+        PostgreSQL sorts NULL values last in ascending order and first in
+        descending order, so nullable columns need an expanded condition.
+        """
+        if None not in values and not any(
+                getattr(column.expression, 'nullable', True) for column in columns):
+            if descending:
+                return tuple_(*columns) < tuple_(*values)
+            return tuple_(*columns) > tuple_(*values)
+
+        column, value = columns[0], values[0]
+        nullable = getattr(column.expression, 'nullable', True)
+        if value is None:
+            after = column.isnot(None) if descending else None
+            same = column.is_(None)
+        else:
+            after = column < value if descending else column > value
+            if nullable and not descending:
+                after = or_(after, column.is_(None))
+            same = column == value
+
+        clauses = [] if after is None else [after]
+        if len(columns) > 1:
+            clauses.append(and_(same, self._keyset_filter(columns[1:], values[1:], descending)))
+        return or_(*clauses) if clauses else false()
+
+    def _cursor_hash(self, search, sort, order):
+        """
+        Return a hash of the grid query a cursor is issued for.
+        """
+        return hashlib.sha1(json.dumps([search, sort, order]).encode('utf-8')).hexdigest()[:16]
+
+    def _encode_cursor(self, search, sort, order, values):
+        payload = json.dumps([self._cursor_hash(search, sort, order), values], default=str)
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def _decode_cursor(self, cursor, search, sort, order, length):
+        """
+        Return the key values stored in ``cursor``, or ``None`` if the cursor
+        is missing, invalid or was built for another search or sort.
+        """
+        if not cursor:
+            return None
+        try:
+            cursor_hash, values = json.loads(
+                base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (ValueError, TypeError):
+            logger.warning('Invalid grid cursor: %s', cursor)
+            return None
+        if cursor_hash != self._cursor_hash(search, sort, order) or \
+                not isinstance(values, list) or len(values) != length:
+            return None
+        return values
 
     def _form(self, schema=None, **kwargs):
         self._schema = (schema or self._base_schema).bind(
             request=self._request,
             dbsession=self._request.dbsession)
 
+        # the widgets get the request of their field, see deform_ext.field_request
         form = Form(
             self._schema,
             buttons=[Button(name='formsubmit', title=_('Submit'))],
+            request=self._request,
             **kwargs
         )
 
@@ -344,6 +1295,22 @@ class AbstractViews():
         for child in node:
             self._populate_widgets(child)
 
+    def _prefetch_widgets(self, node, value):
+        """ Give the values of the form to the widgets which load labels, like
+        ``deform_ext.RelationSearchWidget``, so that they are loaded with one
+        query per model, whatever the number of sequence items.
+        """
+        if value is null or value is None:
+            return
+        if hasattr(node.widget, 'prefetch_labels'):
+            node.widget.prefetch_labels([value], self._request)
+        if isinstance(node.typ, Mapping) and isinstance(value, dict):
+            for child in node:
+                self._prefetch_widgets(child, value.get(child.name))
+        elif isinstance(node.typ, Sequence) and isinstance(value, (list, tuple)):
+            for item in value:
+                self._prefetch_widgets(node.children[0], item)
+
     def _is_new(self):
         return self._request.matchdict.get('id') == "new"
 
@@ -371,41 +1338,52 @@ class AbstractViews():
             )
         ]
 
+    def _item_url(self, route_name, item_id):
+        """
+        Return the URL of ``route_name`` for ``item_id``.
+
+        The route URL is only generated once per request, with a placeholder
+        which is then replaced by the id, quoted as one path segment.
+        """
+        template = self._url_templates.get(route_name)
+        if template is None:
+            template = self._url_templates[route_name] = \
+                self._request.route_url(route_name, id=_ID_PLACEHOLDER)
+        return template.replace(_ID_PLACEHOLDER, quote_path_segment(str(item_id), safe=PATH_SEGMENT_SAFE))
+
     def _grid_item_actions(self, item):
         actions = self._item_actions(item)
+        url = self._item_url('c2cgeoform_item', getattr(item, self._id_field))
         actions.insert(0, ItemAction(
             name='edit',
             label=_('Edit'),
             icon='glyphicon glyphicon-pencil',
-            url=self._request.route_url(
-                'c2cgeoform_item',
-                id=getattr(item, self._id_field))))
+            url=url))
         return {
             'dropdown': [action.to_dict(self._request) for action in actions],
-            'dblclick': self._request.route_url(
-                'c2cgeoform_item',
-                id=getattr(item, self._id_field))}
+            'dblclick': url}
+
+    def _is_persistent(self, item):
+        state = inspect(item, raiseerr=False)
+        # projected grid rows are not entities but come from the database
+        return True if state is None else state.persistent
 
     def _item_actions(self, item, readonly=False):
         actions = []
 
-        if inspect(item).persistent and self._model_config().get('duplicate', False):
+        if self._is_persistent(item) and self._model_config().get('duplicate', False):
             actions.append(ItemAction(
                 name='duplicate',
                 label=_('Duplicate'),
                 icon='glyphicon glyphicon-duplicate',
-                url=self._request.route_url(
-                    'c2cgeoform_item_duplicate',
-                    id=getattr(item, self._id_field))))
+                url=self._item_url('c2cgeoform_item_duplicate', getattr(item, self._id_field))))
 
-        if inspect(item).persistent and not readonly:
+        if self._is_persistent(item) and not readonly:
             actions.append(ItemAction(
                 name='delete',
                 label=_('Delete'),
                 icon='glyphicon glyphicon-remove',
-                url=self._request.route_url(
-                    'c2cgeoform_item',
-                    id=getattr(item, self._id_field)),
+                url=self._item_url('c2cgeoform_item', getattr(item, self._id_field)),
                 method='DELETE',
                 confirmation=_('Are your sure you want to delete this record ?')))
 
@@ -419,6 +1397,7 @@ class AbstractViews():
         dict_ = form.schema.dictify(obj)
         if self._is_new():
             dict_.update(self._request.GET)
+        self._prefetch_widgets(form.schema, dict_)
         kwargs = {
             "request": self._request,
             "actions": self._item_actions(obj, readonly=readonly),
@@ -479,6 +1458,7 @@ class AbstractViews():
                 self._request.dbsession.expire_all()
 
         self._populate_widgets(form.schema)
+        self._prefetch_widgets(form.schema, dict_)
         kwargs = {
             "request": self._request,
             "actions": self._item_actions(dest),
@@ -515,7 +1495,8 @@ class AbstractViews():
                     id=self._obj.__getattribute__(self._id_field),
                     _query=[('msg_col', 'submit_ok')]))
         except ValidationFailure as e:
-            self._populate_widgets(form.schema)
+            # the widgets are already populated for this request
+            self._prefetch_widgets(form.schema, e.cstruct)
             kwargs = {
                 "request": self._request,
                 "actions": self._item_actions(obj),
@@ -0,0 +1,16 @@
+from pyramid.httpexceptions import HTTPNotFound
+
+from c2cgeoform.ext.deform_ext import get_remote_widget
+
+
+def relation(request):
+    """ View returning the options of the relation widgets loading them
+    remotely, like ``deform_ext.RelationSelect2Widget`` with ``remote=True``.
+
+    It is registered by ``includeme`` with the permission given by the
+    ``c2cgeoform.relation_permission`` setting.
+    """
+    widget = get_remote_widget(request.matchdict['key'])
+    if widget is None:
+        raise HTTPNotFound()
+    return widget.remote_response(request)
@@ -0,0 +1,313 @@
+from sqlalchemy import desc, func, literal, or_
+from sqlalchemy.dialects import postgresql
+
+
+def search_columns(model, list_fields):
+    """
+    Split the filter columns of the filtrable ``list_fields`` in two lists:
+    the columns of the ``model`` table, which can be indexed together, and
+    the columns of other tables (for example from relationships).
+    """
+    table = model.__table__
+    own_columns = []
+    other_columns = []
+    for field in list_fields:
+        if field.filtrable():
+            column = field.filter_column()
+            if column.expression.table is table:
+                own_columns.append(column)
+            else:
+                other_columns.append(column)
+    return own_columns, other_columns
+
+
+def concatenated(columns):
+    """
+    Return an expression concatenating ``columns`` separated with spaces.
+
+    Unlike ``concat_ws``, the ``||`` operator is immutable and can be used in
+    an index expression.
+    """
+    expression = None
+    for column in columns:
+        value = func.coalesce(column, literal(''))
+        expression = value if expression is None else expression + literal(' ') + value
+    return expression
+
+
+def index_ddl(model, name, expression, using='gin', opclass=None):
+    """
+    Return the ``CREATE INDEX IF NOT EXISTS`` statement for ``expression`` on
+    the ``model`` table.
+    """
+    dialect = postgresql.dialect()
+    return 'CREATE INDEX IF NOT EXISTS {} ON {} USING {} (({}){})'.format(
+        dialect.identifier_preparer.quote(name),
+        dialect.identifier_preparer.format_table(model.__table__),
+        using,
+        expression.compile(
+            dialect=dialect,
+            compile_kwargs={'literal_binds': True, 'include_table': False}),
+        '' if opclass is None else ' ' + opclass)
+
+
+def search_indexes_ddl(views):
+    """
+    Return the DDL statements creating the indexes used by the search backends
+    of the ``views`` classes.
+    """
+    statements = []
+    for view in views:
+        for statement in view._search_backend.index_ddl(view._model, view._list_fields):
+            if statement not in statements:
+                statements.append(statement)
+    return statements
+
+
+def create_search_indexes(connection, views):
+    """
+    Create the indexes used by the search backends of the ``views`` classes.
+
+    Example usage, in the project database initialization script:
+
+    .. code-block:: python
+
+        with engine.begin() as connection:
+            create_search_indexes(connection, [ExcavationViews])
+    """
+    for statement in search_indexes_ddl(views):
+        connection.execute(statement)
+
+
+def registered_views(registry):
+    """
+    Return the ``AbstractViews`` classes registered as Pyramid views in
+    ``registry``, to be used with ``create_search_indexes``.
+    """
+    from c2cgeoform.views.abstract_views import AbstractViews
+
+    views = []
+    for intr in registry.introspector.get_category('views'):
+        view = intr['introspectable']['callable']
+        if isinstance(view, type) and issubclass(view, AbstractViews) and \
+                view._model is not None and view not in views:
+            views.append(view)
+    return views
+
+
+def escape_like(term, escape='\\'):
+    """
+    Escape the ``LIKE`` wildcards of ``term``.
+    """
+    return term.replace(escape, escape * 2).replace('%', escape + '%').replace('_', escape + '_')
+
+
+def relation_search_query(session, model, id_field, label_field, term,
+                          mode='prefix', order_by=None):
+    """
+    Return a query of the ``(id, label)`` tuples of the ``model`` rows whose
+    ``label_field`` matches ``term``, case insensitively, used by the
+    relation widgets loading their options remotely.
+
+    mode
+        ``'prefix'``: the labels starting with ``term``, the query can use a
+        ``btree`` index on ``lower(label)`` with the ``text_pattern_ops``
+        operator class.
+
+        ``'trigram'``: the labels containing ``term``, the most similar
+        first, the query can use a ``pg_trgm`` GIN index on ``lower(label)``.
+
+    The indexes can be created with the statements returned by
+    ``relation_search_index_ddl``.
+    """
+    id_column = getattr(model, id_field)
+    label = getattr(model, label_field)
+    query = session.query(id_column, label)
+
+    term = term.strip().lower()
+    if mode == 'prefix':
+        if term:
+            query = query.filter(
+                func.lower(label).like(escape_like(term) + '%', escape='\\'))
+    elif mode == 'trigram':
+        if term:
+            query = query.filter(
+                func.lower(label).like('%' + escape_like(term) + '%', escape='\\'))
+            query = query.order_by(desc(func.similarity(func.lower(label), term)))
+    else:
+        raise ValueError('Unknown search mode: {}'.format(mode))
+
+    return query.order_by(label if order_by is None else getattr(model, order_by), id_column)
+
+
+def relation_search_index_ddl(model, label_field, mode='prefix'):
+    """
+    Return the DDL statements creating the index used by
+    ``relation_search_query`` for ``mode``.
+    """
+    expression = func.lower(getattr(model, label_field))
+    if mode == 'prefix':
+        return [index_ddl(model, 'ix_{}_{}_prefix'.format(model.__table__.name, label_field),
+                          expression, using='btree', opclass='text_pattern_ops')]
+    return [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        index_ddl(model, 'ix_{}_{}_trgm'.format(model.__table__.name, label_field),
+                  expression, opclass='gin_trgm_ops'),
+    ]
+
+
+class ILikeSearch():
+    """
+    Default grid search backend: each word of the search phrase has to be
+    found, in order, in one of the filtrable list fields, using ``ILIKE``.
+    """
+
+    def filter_query(self, query, model, list_fields, search_phrase):
+        search_expr = '%' + '%'.join(search_phrase.split()) + '%'
+
+        # create `ilike` filters for every list text field
+        filters = []
+        for field in list_fields:
+            if field.filtrable():
+                filters.append(field.filter_expression(search_expr))
+
+        # then join the filters into one `or` condition
+        if len(filters) > 0:
+            query = query.filter(or_(*filters))
+
+        return query
+
+    def rank_query(self, query, model, list_fields, search_phrase):
+        return query
+
+    def index_ddl(self, model, list_fields):
+        return []
+
+
+class TrigramSearch():
+    """
+    Grid search backend for substring matching (like reference numbers),
+    using a single lower-cased expression concatenating the filtrable list
+    fields of the model table, so that one ``pg_trgm`` GIN index serves the
+    whole grid search.
+
+    Like the default backend, each word of the search phrase has to be found,
+    in order. Filtrable list fields from other tables are matched separately
+    with ``ILIKE``.
+
+    Example usage
+
+    .. code-block:: python
+
+        class ExcavationViews(AbstractViews):
+            _search_backend = TrigramSearch()
+
+    The index can be created using ``create_search_indexes``, it requires the
+    ``pg_trgm`` extension.
+    """
+
+    def document(self, model, list_fields):
+        own_columns, dummy = search_columns(model, list_fields)
+        if not own_columns:
+            return None
+        return func.lower(concatenated(own_columns))
+
+    def filter_query(self, query, model, list_fields, search_phrase):
+        search_expr = '%' + '%'.join(search_phrase.lower().split()) + '%'
+        document = self.document(model, list_fields)
+        dummy, other_columns = search_columns(model, list_fields)
+
+        filters = [] if document is None else [document.like(search_expr)]
+        filters += [column.ilike(search_expr) for column in other_columns]
+        if len(filters) > 0:
+            query = query.filter(or_(*filters))
+        return query
+
+    def rank_query(self, query, model, list_fields, search_phrase):
+        return query
+
+    def index_ddl(self, model, list_fields):
+        document = self.document(model, list_fields)
+        if document is None:
+            return []
+        return [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            index_ddl(model, 'ix_{}_search_trgm'.format(model.__table__.name),
+                      document, opclass='gin_trgm_ops'),
+        ]
+
+
+class FullTextSearch():
+    """
+    Grid search backend using PostgreSQL full-text search.
+
+    The search phrase is parsed with ``websearch_to_tsquery`` (PostgreSQL
+    11+), so users can use quotes, ``or`` and ``-``, and matched against a
+    ``tsvector`` built from the filtrable list fields of the model table.
+    Filtrable list fields from other tables are matched separately.
+
+    Example usage
+
+    .. code-block:: python
+
+        class ExcavationViews(AbstractViews):
+            _search_backend = FullTextSearch('french', rank=True)
+
+    The ``tsvector`` can be stored in a generated column of the model table,
+    or indexed using ``create_search_indexes``.
+
+    **Attributes/Arguments**
+
+    config
+        The text search configuration. Default: ``'simple'``.
+
+    column
+        Name of a ``tsvector`` column of the model to use instead of the
+        expression built from the list fields. Default: ``None``.
+
+    rank
+        Order results by relevance, with ``ts_rank``, when the grid is not
+        explicitly sorted. Default: ``False``.
+    """
+
+    def __init__(self, config='simple', column=None, rank=False):
+        self.config = config
+        self.column = column
+        self.rank = rank
+
+    def document(self, model, list_fields):
+        if self.column is not None:
+            return getattr(model, self.column)
+        own_columns, dummy = search_columns(model, list_fields)
+        if not own_columns:
+            return None
+        return func.to_tsvector(self.config, concatenated(own_columns))
+
+    def _tsquery(self, search_phrase):
+        return func.websearch_to_tsquery(self.config, search_phrase)
+
+    def filter_query(self, query, model, list_fields, search_phrase):
+        tsquery = self._tsquery(search_phrase)
+        document = self.document(model, list_fields)
+        dummy, other_columns = search_columns(model, list_fields)
+
+        filters = [] if document is None else [document.op('@@')(tsquery)]
+        filters += [
+            func.to_tsvector(self.config, column).op('@@')(tsquery)
+            for column in other_columns
+        ]
+        if len(filters) > 0:
+            query = query.filter(or_(*filters))
+        return query
+
+    def rank_query(self, query, model, list_fields, search_phrase):
+        document = self.document(model, list_fields)
+        if not self.rank or document is None:
+            return query
+        return query.order_by(desc(func.ts_rank(document, self._tsquery(search_phrase))))
+
+    def index_ddl(self, model, list_fields):
+        document = self.document(model, list_fields)
+        if document is None:
+            return []
+        return [index_ddl(model, 'ix_{}_search_fts'.format(model.__table__.name), document)]
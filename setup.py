@@ -31,6 +31,9 @@ setup(
     zip_safe=False,
     test_suite='c2cgeoform',
     install_requires=REQUIRES,
+    extras_require={
+        'xlsx': ['xlsxwriter'],
+    },
     entry_points={
         'paste.app_factory': [
             'main=c2cgeoform:main',